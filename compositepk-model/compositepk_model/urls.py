@@ -15,6 +15,7 @@ urlpatterns = [
     path('artisit/<int:id>/album/', views.AlbumListView.as_view(), name='album'),
     path('artisit/<int:id>/album/add/', views.AlbumFormView.as_view(), name='add_album'),
     path('artisit/<int:id>/album/set_5stars/', views.set_5stars, name='set_5stars'),
+    path('artisit/<int:id>/album/json/', views.album_json, name='album_json'),
     path('company/', views.CompanyListView.as_view(), name='company'),
     path('company/<int:id>/branch/',views.CompanyBranchListView.as_view(), name='companybranch'),
     path('company/<int:id>/branch/add', views.CompanyBranchFormView.as_view(), name='add_companybranch'),
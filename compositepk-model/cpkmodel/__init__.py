@@ -3,13 +3,21 @@ Package for the application library(Mulit-Column Primary Keys)
 """
 
 from .cpkmodel import CPkModel
+from .related import CPkForeignKey
+from .paginator import KeysetPage, KeysetPaginationMixin, KeysetPaginator
+from .identitymap import IdentityMap, IdentityMapMiddleware, identity_map
+from .rowcache import CPkCache
+from .instrumentation import CPkStats, collect_stats, cpk_event
 from .cpkquery import (
     CPkQuery,
     CPkDeleteQuery,
     CPkUpdateQuery,
     CPkQuerySet,
+    CPkManager,
 )
 
 __all__ = [
-    'CPkModel','CPkQuery','CPkDeleteQuery','CPkUpdateQuery','CPkQuerySet'
+    'CPkModel','CPkForeignKey','CPkQuery','CPkDeleteQuery','CPkUpdateQuery','CPkQuerySet','CPkManager',
+    'KeysetPage','KeysetPaginator','KeysetPaginationMixin','IdentityMap','IdentityMapMiddleware','identity_map',
+    'CPkCache','CPkStats','collect_stats','cpk_event'
 ]
\ No newline at end of file
@@ -1,7 +1,57 @@
+from collections import namedtuple
+from functools import lru_cache
+from operator import attrgetter
+
 from django.db.models import Field
 from django.db.models.expressions import Col
 
+from . import instrumentation
 from .constants import CPK_SEP
+from .lookups import (
+    CompositeIn,
+    CompositeGreaterThan,
+    CompositeGreaterThanOrEqual,
+    CompositeLessThan,
+    CompositeLessThanOrEqual,
+)
+
+
+@lru_cache(maxsize=1024)
+def split_names(name):
+    """ Split the multi-column name joined by CPK_SEP. """
+    return tuple(name.split(CPK_SEP))
+
+
+class PkPlan(namedtuple('PkPlan', ['keys', 'names', 'desc_names', 'attnames', 'columns', 'getter'])):
+    """
+    Access plan to the primary keys of a model, precompiled by CPkModelBase.
+      getter : returns the tuple of the key values of an instance.
+    """
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, keys):
+        attnames = tuple(key.attname for key in keys)
+        if len(attnames) > 1:
+            getter = attrgetter(*attnames)
+        elif attnames:
+            get_one = attrgetter(attnames[0])
+            getter = lambda obj: (get_one(obj),)
+        else:
+            getter = lambda obj: ()
+        names = tuple(key.name for key in keys)
+        return cls(
+            keys=keys,
+            names=names,
+            desc_names=tuple('-' + name for name in names),
+            attnames=attnames,
+            columns=tuple(key.column for key in keys),
+            getter=getter,
+        )
+
+    def lookups(self, vals):
+        """ Return the lookups by attnames for the key values. """
+        return dict(zip(self.attnames, vals))
 
 
 class CompositeCol(Col):
@@ -9,12 +59,13 @@ class CompositeCol(Col):
         super().__init__(alias, target, output_field)
         self.children = [Col(alias, key, output_field) for key in target.keys]
 
+    def compile_cols(self, compiler):
+        """ Return the compiled sql of each key column. """
+        with instrumentation.timer('composite_col', self.target.model):
+            return [compiler.compile(child)[0] for child in self.children]
+
     def as_sql(self, compiler, connection):
-        sqls = []
-        for child in self.children:
-            sql, _ = child.as_sql(compiler, connection)
-            sqls.append(sql)
-        return "(%s)" % ",".join(sqls), []
+        return "(%s)" % ",".join(self.compile_cols(compiler)), []
 
 
 class CompositeKey(Field):
@@ -36,3 +87,10 @@ class CompositeKey(Field):
 
     def get_col(self, alias, output_field=None):
         return CompositeCol(alias, self, output_field)
+
+
+CompositeKey.register_lookup(CompositeIn)
+CompositeKey.register_lookup(CompositeGreaterThan)
+CompositeKey.register_lookup(CompositeGreaterThanOrEqual)
+CompositeKey.register_lookup(CompositeLessThan)
+CompositeKey.register_lookup(CompositeLessThanOrEqual)
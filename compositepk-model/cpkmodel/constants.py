@@ -4,3 +4,22 @@ Constants used across the ORM extended for Composite Primary Key in general.
 
 # Separator used to split primary keys strings apart.
 CPK_SEP = ','
+
+# Strategies used to compile a multi-column 'in' lookup.
+#   ROW_VALUE : (a,b) IN ((%s,%s),(%s,%s))
+#   EXPANDED  : ((a=%s AND b=%s) OR (a=%s AND b=%s))
+#   DERIVED   : (a,b) IN (SELECT ... FROM <derived table of keys>)
+IN_ROW_VALUE = 'row_value'
+IN_EXPANDED = 'expanded'
+IN_DERIVED = 'derived'
+
+# Number of keys from which a multi-column 'in' lookup is compiled
+# as a derived table join(if the backend supports it).
+IN_DERIVED_THRESHOLD = 100
+
+# Number of keys fetched and deleted at once by CPkQuerySet.delete()
+# when the rows can't be deleted by one DELETE.
+DELETE_CHUNK_SIZE = 1000
+
+# Number of rows read at once by CPkQuerySet.export().
+EXPORT_CHUNK_SIZE = 5000
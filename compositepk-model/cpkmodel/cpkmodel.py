@@ -1,11 +1,19 @@
 from django.db import router
 from django.db.models import Model
 from django.db.models.base import ModelBase
+from django.db.models.options import Options
+from django.utils.functional import cached_property
 from django.db.models.deletion import Collector
+from django.db.models.fields.related_descriptors import ForeignKeyDeferredAttribute
+from django.db.models.manager import BaseManager
+from django.db.models.query_utils import DeferredAttribute
 
+from . import identitymap, rowcache
 from .constants import CPK_SEP
-from .compositekey import CompositeKey
-from .cpkquery import CPkQuerySet
+from .compositekey import CompositeKey, PkPlan, split_names
+from .cpkquery import CPkManager, CPkQuerySet
+from .lookups import CPkStr
+from .related import get_instance_value_for_fields
 
 
 class CompositePk(CompositeKey):
@@ -13,33 +21,127 @@ class CompositePk(CompositeKey):
         super().__init__(keys, primary=True)
         
 
+class CPkOptions(Options):
+    """ Options of CPkModel. """
+    def get_field(self, field_name):
+        # MEMO: Collector deletes instances by Django's DeleteQuery with
+        #         the lookup '<pk.attname>__in', so resolve CompositePk by its name.
+        if self.pk is not None and field_name == self.pk.name:
+            return self.pk
+        if CPK_SEP in field_name:
+            # Multi-Column on the relation model(e.g. 'relmodel__id1,id2__in')
+            return self.get_composite_key(field_name)
+        return super().get_field(field_name)
+
+    @cached_property
+    def pk_fields(self):
+        # MEMO: Django(>=5.2) finds the primary key of the related objects
+        #         by pk_fields in select_related.
+        if isinstance(self.pk, CompositeKey):
+            return list(self.pk.keys)
+        return [self.pk]
+
+    @cached_property
+    def managers(self):
+        # MEMO: managers are copied again when the cache of Options expires.
+        managers = super().managers
+        for manager in managers:
+            if not issubclass(manager._queryset_class, CPkQuerySet):
+                manager._queryset_class = CPkQuerySet
+        return managers
+
+    @cached_property
+    def base_manager(self):
+        manager = super().base_manager
+        manager._queryset_class = CPkQuerySet
+        return manager
+
+    def get_composite_key(self, name):
+        """
+        Return CompositeKey of the columns in 'name' joined by CPK_SEP.
+          It's cached until the cache of fields expires(e.g. apps.clear_cache).
+        """
+        ckeys = self.__dict__.setdefault('_composite_keys', {})
+        try:
+            return ckeys[name]
+        except KeyError:
+            cols = [self.get_field(col) for col in split_names(name)]
+            ckey = ckeys[name] = CompositeKey(cols)
+            return ckey
+
+    def _expire_cache(self, forward=True, reverse=True):
+        super()._expire_cache(forward, reverse)
+        if forward:
+            self.__dict__.pop('_composite_keys', None)
+
+
+# Names of the cached primary key in the instance.
+PKVALS_CACHE = '_cpk_vals'
+PKSTR_CACHE = '_cpk_str'
+
+
+def clear_pk_cache(instance):
+    data = instance.__dict__
+    data.pop(PKVALS_CACHE, None)
+    data.pop(PKSTR_CACHE, None)
+
+
+class CPkKeyAttribute(DeferredAttribute):
+    """ Descriptor of a key field, which clears the cached pk when assigned. """
+    def __set__(self, instance, value):
+        instance.__dict__[self.field.attname] = value
+        clear_pk_cache(instance)
+
+
+class CPkForeignKeyAttribute(ForeignKeyDeferredAttribute):
+    """ Descriptor of a ForeignKey key field, which clears the cached pk when assigned. """
+    def __set__(self, instance, value):
+        super().__set__(instance, value)
+        clear_pk_cache(instance)
+
+
 class CPkModelMixin:
     @property
     def pkvals(self):
-        return tuple(getattr(self, key.attname) for key in self.pkeys)
+        # cached until a key field is assigned.
+        data = self.__dict__
+        try:
+            return data[PKVALS_CACHE]
+        except KeyError:
+            vals = data[PKVALS_CACHE] = self.pkplan.getter(self)
+            return vals
 
     def _get_cpk_val(self, meta=None):
-        meta = meta or self._meta
-        key_values = getattr(self, 'pkvals')
+        # string joined by CPK_SEP for admin and URLs, rendered lazily.
+        #   MEMO: Collector deletes(or updates) the rows by '<pk.attname>__in'
+        #           with this value, so it keeps the key tuple(see CPkStr).
+        data = self.__dict__
+        try:
+            return data[PKSTR_CACHE]
+        except KeyError:
+            pass
+        key_values = self.pkvals
         if key_values:
             if None in key_values:
                 return None
             else:
-                strvalues = tuple((str(val) for val in key_values))
-                value = CPK_SEP.join(strvalues)
-                # MEMO: record for admin
-                setattr(self, meta.pk.attname, value)
+                value = data[PKSTR_CACHE] = CPkStr(key_values)
                 return value
         else:
             return None
 
     def _set_cpk_val(self, value):
-        super()._set_pk_val(value)
-        # set into original filelds
-        meta = self._meta
-        vals = value.split(CPK_SEP)
+        # set into original filelds, typed by each key field.
+        if value is None:
+            vals = (None,) * len(self.pkeys)
+        elif isinstance(value, CPkStr):
+            vals = value.vals
+        elif isinstance(value, str):
+            vals = value.split(CPK_SEP)
+        else:
+            vals = value
         for key, val in zip(self.pkeys, vals):
-            setattr(self, key.attname, val)
+            setattr(self, key.attname, None if val is None else key.to_python(val))
 
     cpk = property(_get_cpk_val, _set_cpk_val)
 
@@ -49,9 +151,7 @@ class CPkModelMixin:
 
     def get_pk_lookups(self):
         if self.has_compositepk:
-            keys = self.pkeys
-            vals = self.pkvals
-            return { key.attname:val for key, val in zip(keys, vals)}
+            return self.pkplan.lookups(self.pkvals)
         else:
             return { 'pk':self.pk }
         
@@ -59,6 +159,35 @@ class CPkModelMixin:
     ###########################
     # override
     ###########################
+    def save(self, *args, upsert=None, **kwargs):
+        """
+        Save the current instance.
+          upsert : INSERT ... ON CONFLICT (pk cols) DO UPDATE for a new instance.
+                   The default is Meta.upsert_on_save.
+        """
+        self._cpk_upsert = upsert
+        try:
+            Model.save(self, *args, **kwargs)
+        finally:
+            del self._cpk_upsert
+    save.alters_data = True
+
+    def _save_table(self, raw=False, cls=None, force_insert=False,
+                    force_update=False, using=None, update_fields=None):
+        cls = cls or self.__class__
+        upsert = getattr(self, '_cpk_upsert', None)
+        if upsert is None:
+            upsert = cls.upsert_on_save
+        if (upsert and self._state.adding and not raw
+                and not (force_insert or force_update or update_fields)
+                and cls._meta.concrete_model is self._meta.concrete_model):
+            # One statement, instead of UPDATE and INSERT.
+            # MEMO: post_save is sent with created=True, because it isn't known
+            #       whether the row was inserted or updated.
+            cls._base_manager.using(using).bulk_upsert([self])
+            return False
+        return Model._save_table(self, raw, cls, force_insert, force_update, using, update_fields)
+
     def delete(self, using=None, keep_parents=False):
         using = using or router.db_for_write(self.__class__, instance=self)
         assert self.pk is not None, (
@@ -73,10 +202,21 @@ class CPkModelMixin:
         #
         #collector.collect([self], keep_parents=keep_parents)
         model = self._meta.model
-        qs = model.objects.filter(pk=self.pk)
+        qs = model._base_manager.using(using).filter(**self.get_pk_lookups())
         collector.collect(qs, keep_parents=keep_parents)
         # Change E
-        return collector.delete()
+        identitymap.clear()
+        with rowcache.invalidating(model, using, deleted=True):
+            return collector.delete()
+    delete.alters_data = True
+
+    def _delete_single(self, using=None, keep_parents=False):
+        # delete() of the model with single primary key.
+        using = using or router.db_for_write(self.__class__, instance=self)
+        identitymap.clear()
+        with rowcache.invalidating(self.__class__, using, deleted=True):
+            return Model.delete(self, using, keep_parents)
+    _delete_single.alters_data = True
 
 
 class CPkModelBase(ModelBase):
@@ -94,6 +234,20 @@ class CPkModelBase(ModelBase):
                     modelbases.append(Model)
                 else:
                     modelbases.append(base)
+            # MEMO: CPkManager(made by from_queryset) isn't a subclass of Manager.
+            has_manager = any(isinstance(value, BaseManager) for value in attrs.values())
+            inherits_manager = any(
+                getattr(base, '_meta', None) is not None and base._meta.managers for base in bases
+            )
+            if not (has_manager or inherits_manager):
+                # default manager with the methods of CPkQuerySet
+                attrs['objects'] = CPkManager()
+            # Options of CPkModel in Meta
+            attr_meta = attrs.get('Meta')
+            upsert_on_save = getattr(attr_meta, 'upsert_on_save', None)
+            if attr_meta and 'upsert_on_save' in attr_meta.__dict__:
+                # Django's Options doesn't allow unknown attributes.
+                delattr(attr_meta, 'upsert_on_save')
             super_new = super().__new__(cls, name, tuple(modelbases), attrs, **kwargs)
             meta = super_new._meta
             pkeys = tuple(f for f in meta.local_concrete_fields if f.primary_key)
@@ -104,15 +258,36 @@ class CPkModelBase(ModelBase):
                 setattr(super_new, "pk", CPkModelMixin.cpk)
                 setattr(super_new, "_get_pk_val", CPkModelMixin._get_cpk_val)
                 setattr(super_new, "_set_pk_val", CPkModelMixin._set_cpk_val)
-                setattr(super_new, meta.pk.attname, None)
+                # MEMO: admin gets the pk by its attname.
+                setattr(super_new, meta.pk.attname, CPkModelMixin.cpk)
                 setattr(super_new, "_check_single_primary_key", CPkModelMixin._no_check)
                 setattr(super_new, "delete", CPkModelMixin.delete)
+                if super_new.save is Model.save:
+                    # Don't override save() of the model.
+                    setattr(super_new, "save", CPkModelMixin.save)
+                setattr(super_new, "_save_table", CPkModelMixin._save_table)
+                for key in pkeys:
+                    if key.is_relation:
+                        # MEMO: ForeignObject uses instance.pk for the value of the primary key,
+                        #         it's used to match the objects in prefetch_related.
+                        key.get_instance_value_for_fields = get_instance_value_for_fields
             else:
                 super_new.has_compositepk = False
+                if super_new.delete is Model.delete:
+                    setattr(super_new, "delete", CPkModelMixin._delete_single)
             setattr(super_new, "get_pk_lookups", CPkModelMixin.get_pk_lookups)
-            meta.base_manager._queryset_class = CPkQuerySet
-            meta.default_manager._queryset_class = CPkQuerySet           
+            meta.__class__ = CPkOptions
+            # drop managers cached by Options
+            meta._expire_cache(reverse=False)
+            if upsert_on_save is not None:
+                super_new.upsert_on_save = upsert_on_save
+            elif not hasattr(super_new, 'upsert_on_save'):
+                super_new.upsert_on_save = False
+            for key in pkeys:
+                descriptor_class = CPkForeignKeyAttribute if key.is_relation else CPkKeyAttribute
+                setattr(super_new, key.attname, descriptor_class(key))
             super_new.pkeys = pkeys
+            super_new.pkplan = PkPlan.build(pkeys)
             super_new.pkvals = CPkModelMixin.pkvals
             super_new._meta = meta
             return super_new
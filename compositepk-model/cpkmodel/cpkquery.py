@@ -1,20 +1,135 @@
 import copy
+from collections import Counter, namedtuple
+from operator import attrgetter, itemgetter
+from weakref import WeakKeyDictionary
 
+from asgiref.sync import sync_to_async
+
+from django.core.exceptions import FieldDoesNotExist
 from django.db import connections,transaction
 from django.db.models import QuerySet,Q
-from django.db.models.sql import Query, DeleteQuery, UpdateQuery
+from django.db.models.deletion import Collector
+from django.db.models.manager import BaseManager
+from django.db.models.query import (
+    FlatValuesListIterable, ModelIterable, ValuesIterable, ValuesListIterable,
+)
+from django.db.models.sql import Query, DeleteQuery, UpdateQuery, InsertQuery
 from django.db.models.constants import LOOKUP_SEP
 from django.db.models.expressions import Case, Expression, Value, When
 from django.db.models.functions import Cast
 from django.db.utils import NotSupportedError,ProgrammingError
 
-from .constants import CPK_SEP
-from .compositekey import CompositeKey
+from . import export, identitymap, instrumentation, rowcache
+from .constants import CPK_SEP, DELETE_CHUNK_SIZE, EXPORT_CHUNK_SIZE
+from .deletion import CPkCollector, can_delete_by_keys
+from .compositekey import split_names
+from .lookups import COMPARE_OPERATORS, CPkStr, compile_in, supports_derived_in
+
+try:
+    from django.db.models.constants import OnConflict
+except ImportError:
+    # Django < 4.1
+    OnConflict = None
+
+
+FetchTemplate = namedtuple('FetchTemplate', 'select_sql exact_sql cols attnames converters')
+
+# Templates of CPkQuerySet.fetch() for each connection.
+#   The converters are bound to the connection(of the thread).
+_fetch_templates = WeakKeyDictionary()
+
+
+def get_fetch_template(model, connection, fields=None):
+    """
+    Return the FetchTemplate of 'model' loading 'fields'(and the keys).
+    It's compiled once for each connection by the compiler of Django.
+    """
+    templates = _fetch_templates.setdefault(connection, {})
+    template = templates.get((model, fields))
+    if template is None:
+        queryset = model._base_manager.db_manager(connection.alias).order_by()
+        if fields is not None:
+            queryset = queryset.only(*model.pkplan.names, *fields)
+        compiler = queryset.query.get_compiler(connection=connection)
+        select_sql, _ = compiler.as_sql()
+        select = [col for col, _, _ in compiler.select]
+        alias = compiler.query.get_initial_alias()
+        cols = [compiler.compile(key.get_col(alias))[0] for key in model.pkeys]
+        exact_sql = '%s WHERE %s' % (select_sql, ' AND '.join('%s = %%s' % col for col in cols))
+        template = FetchTemplate(
+            select_sql, exact_sql, cols,
+            [col.target.attname for col in select],
+            compiler.get_converters(select),
+        )
+        templates[(model, fields)] = template
+    return template
+
+
+RowPlan = namedtuple('RowPlan', 'row_class select make')
+
+# RowPlans of CPkQuerySet.rows() for each model and fields.
+_row_plans = {}
+
+
+def get_row_plan(model, fields):
+    """
+    Return the RowPlan of 'model' for the record of 'fields'.
+      row_class : namedtuple of 'key' and 'fields'.
+      select    : names for values_list(), the keys first and 'fields' not in the keys.
+      make      : returns the record from the row of values_list(select).
+    """
+    plan = _row_plans.get((model, fields))
+    if plan is None:
+        select, positions = select_keys_first(model, fields)
+        row_class = namedtuple('%sRow' % model.__name__, ('key',) + fields)
+        num_keys = len(model.pkplan.keys)
+        new = tuple.__new__
+        if len(fields) > 1:
+            get_values = itemgetter(*positions)
+            make = lambda row: new(row_class, (row[:num_keys], *get_values(row)))
+        elif fields:
+            pos = positions[0]
+            make = lambda row: new(row_class, (row[:num_keys], row[pos]))
+        else:
+            make = lambda row: new(row_class, (row[:num_keys],))
+        plan = _row_plans[(model, fields)] = RowPlan(row_class, select, make)
+    return plan
+
+
+def select_keys_first(model, fields):
+    """
+    Return the names for values_list(), the keys first and 'fields' not in the keys,
+    and the position of each of 'fields' in them.
+    """
+    keys = model.pkplan.keys
+    positions = {}
+    for pos, key in enumerate(keys):
+        positions[key.name] = positions[key.attname] = pos
+    if len(keys) == 1:
+        positions['pk'] = 0
+    select = list(model.pkplan.attnames)
+    for name in fields:
+        if name not in positions:
+            positions[name] = len(select)
+            select.append(name)
+    return tuple(select), [positions[name] for name in fields]
+
+
+class RowIterable(ValuesListIterable):
+    """
+    Iterable returned by CPkQuerySet.rows() that yields a namedtuple
+    of the key tuple and the fields for each row.
+    """
+    def __iter__(self):
+        queryset = self.queryset
+        make = get_row_plan(queryset.model, queryset._row_fields).make
+        for row in super().__iter__():
+            yield make(row)
 
 
 class CPkQueryMixin():
     def _get_pk_names(self):
-        return tuple(key.name for key in self.model.pkeys)
+        return self.model.pkplan.names
 
     ###########################
     # override
@@ -32,6 +147,10 @@ class CPkQueryMixin():
         return super().chain(klass=cpk_klass)
 
     def names_to_path(self, names, opts, allow_many=True, fail_on_missing=False):
+        with instrumentation.timer('names_to_path', self.model):
+            return self._names_to_path(names, opts, allow_many, fail_on_missing)
+
+    def _names_to_path(self, names, opts, allow_many, fail_on_missing):
         meta = self.get_meta()
         first_name = names[0]
         # name[0] is Multi-Column ?
@@ -39,9 +158,8 @@ class CPkQueryMixin():
             # get CompisteKey
             ckey = meta.pk
             if first_name != 'pk' and first_name != ckey.name:
-                # IF Not PK, mnake another CompositeKey
-                cols = [meta.get_field(col) for col in first_name.split(CPK_SEP)]
-                ckey = CompositeKey(cols)
+                # IF Not PK, get another CompositeKey(cached in meta)
+                ckey = meta.get_composite_key(first_name)
             lookups = names[1:] if len(names) > 1 else []
             return [], ckey, (ckey,), lookups
         else:
@@ -54,23 +172,24 @@ class CPkQueryMixin():
                 if item == 'pk':
                     new_ordering += self._get_pk_names()
                 elif item == '-pk':
-                    names = tuple('-' + name for name in self._get_pk_names())                    
-                    new_ordering += names
+                    new_ordering += self.model.pkplan.desc_names
                 else:
                     new_ordering += (item,)
             super().add_ordering(*new_ordering)
         else:
             super().add_ordering(*ordering)
 
-    def add_q(self, q_object):
+    def add_q(self, q_object, *args, **kwargs):
         def separate_key(self, key):
             if key == 'pk':
                 return self._get_pk_names()
             else:
-                return tuple(key.split(CPK_SEP))
+                return split_names(key)
 
         def separate_value(keys, value):
-            if isinstance(value, str):
+            if isinstance(value, CPkStr):
+                return value.vals
+            elif isinstance(value, str):
                 return tuple(value.split(CPK_SEP))
             elif isinstance(value, tuple):
                 return value
@@ -82,6 +201,52 @@ class CPkQueryMixin():
             else:
                 return (value,)
 
+        def equality_key(lookup):
+            # Return the composite key name of 'pk=' or 'multi-column=', or None.
+            names = lookup.split(LOOKUP_SEP)
+            if len(names) == 2 and names[1] == 'exact':
+                names = names[:1]
+            if len(names) != 1:
+                return None
+            name = names[0]
+            meta = self.get_meta()
+            if name == 'pk' or name == meta.pk.name:
+                return 'pk' if self.model.has_compositepk else None
+            if CPK_SEP not in name:
+                return None
+            try:
+                ckey = meta.get_composite_key(name)
+            except FieldDoesNotExist:
+                return None
+            # MEMO: NOT IN doesn't match the rows with NULL,
+            #         but exclude() of each column does.
+            return None if any(key.null for key in ckey.keys) else name
+
+        def fold_equalities(children):
+            # Fold OR-ed 'pk=' of the same key to one 'pk__in'.
+            #   [('pk', v1), ('pk', v2), ...] -> [('pk__in', [v1, v2, ...])]
+            groups = {}
+            for child in children:
+                if isinstance(child, tuple):
+                    name = equality_key(child[0])
+                    if name is not None:
+                        groups.setdefault(name, []).append(child[1])
+            for name, vals in list(groups.items()):
+                keys = separate_key(self, name)
+                if len(vals) < 2 or any(len(separate_value(keys, val)) != len(keys) for val in vals):
+                    del groups[name]
+            if not groups:
+                return children
+            new_children = []
+            for child in children:
+                name = equality_key(child[0]) if isinstance(child, tuple) else None
+                if name not in groups:
+                    new_children.append(child)
+                elif groups[name] is not None:
+                    new_children.append((name + LOOKUP_SEP + 'in', groups[name]))
+                    groups[name] = None
+            return new_children
+
         def transform_q(obj):
             def make_q(keys, vals):
                 q = Q()
@@ -89,15 +254,18 @@ class CPkQueryMixin():
                     q.children.append((key, val))
                 return q
 
-            assert isinstance(obj, (Q, tuple))
             if isinstance(obj, Q):
                 # When obj is Q, transform children.
                 new_q = copy.copy(obj)
                 new_q.children = []
-                for child in obj.children:
+                children = obj.children
+                if obj.connector == Q.OR:
+                    # NOT of the folded 'in' is NOT IN for exclude().
+                    children = fold_equalities(children)
+                for child in children:
                     new_q.children.append(transform_q(child))
                 return new_q
-            else:
+            elif isinstance(obj, tuple):
                 # When obj is tuple,
                 #  obj[0] is lhs(lookup expression)
                 #       pk and multi column with lookup 'in' is nothing to do in this, it will change in 'names_to_path'. 
@@ -118,14 +286,22 @@ class CPkQueryMixin():
                         # check the last name
                         last = names[-1]
                         if last == 'in':
-                            if len(names) == 2:
-                                # for 'pk__in' or 'multi-column__in'
+                            if len(names) == 2 or CPK_SEP in names[-2]:
+                                # for 'pk__in', 'multi-column__in' or 'relmodel__multi-column__in'
+                                #   multi-column on the relation model is resolved by CPkOptions.get_field.
                                 keys = separate_key(self, names[-2])
                                 new_vals = [separate_value(keys, val) for val in obj[1]]
                                 return (obj[0], new_vals)
-                            elif CPK_SEP in names[-2]:
-                                # multi-column is not supported.
-                                raise NotSupportedError("Not supported multi-column with'in' on relation model : {}".format(obj[0]))
+                        elif last in COMPARE_OPERATORS:
+                            # for 'pk__gt', 'multi-column__gt' or 'relmodel__multi-column__gt'
+                            #   compared in the lexicographic order of the columns.
+                            #   'relmodel__pk__gt' is resolved by CPkOptions.get_field.
+                            if len(names) == 2 or CPK_SEP in names[-2]:
+                                keys = separate_key(self, names[-2])
+                                vals = separate_value(keys, obj[1])
+                                if len(keys) != len(vals):
+                                    raise ProgrammingError("Parameter unmatch : key={} val={}".format(keys, vals))
+                                return (obj[0], vals)
                         elif last == 'pk' or CPK_SEP in last:
                             # change one Q to multi Q
                             #  example: ('relmodel__id1,id2', (valule1,value2))
@@ -141,10 +317,12 @@ class CPkQueryMixin():
                         else:
                             # another lookup is not supported.
                             raise NotSupportedError("Not supported multi-column with '{}' : {}".format(last,obj[0]))
-                return obj
+            # Expressions(e.g. Lookup) are nothing to do.
+            return obj
 
-        new_q = transform_q(q_object)
-        super().add_q(new_q)
+        with instrumentation.timer('transform_q', self.model):
+            new_q = transform_q(q_object)
+        super().add_q(new_q, *args, **kwargs)
 
 
 class CPkQuery(CPkQueryMixin, Query):
@@ -168,10 +346,518 @@ class CPkQuerySet(QuerySet):
         if not query:
             query = CPkQuery(model)
         super().__init__(model, query, using, hints)
+        self._row_fields = None
+
+    def _clone(self):
+        clone = super()._clone()
+        clone._row_fields = self._row_fields
+        return clone
+
+    def get(self, *args, **kwargs):
+        """
+        Perform the query and return a single object matching the given
+        keyword arguments. get(pk=...) is served from the active IdentityMap.
+        """
+        imap = identitymap.get_identity_map()
+        if imap is not None and not args and len(kwargs) == 1 and self._is_plain_query():
+            (name, value), = kwargs.items()
+            key = None
+            if name in ('pk', self.model._meta.pk.name):
+                key = identitymap.make_key(self.model, value)
+            if key is not None:
+                obj = imap.get(self.model, self.db, key)
+                if obj is None:
+                    obj = super().get(**kwargs)
+                    imap.add(obj, self.db)
+                return obj
+        return super().get(*args, **kwargs)
+
+    def update(self, **kwargs):
+        self._for_write = True
+        identitymap.invalidate(self.model)
+        with rowcache.invalidating(self.model, self.db):
+            return super().update(**kwargs)
+    update.alters_data = True
+
+    def delete(self):
+        """
+        Delete the records in the current QuerySet.
+          If the rows can't be deleted by one DELETE(e.g. cascades, or joins
+          in the filters), only the keys are fetched by chunks, and the rows
+          and the cascades are deleted by the keys(see CPkCollector).
+        """
+        # The objects of other models may be deleted by cascades.
+        self._for_write = True
+        identitymap.clear()
+        with rowcache.invalidating(self.model, self.db, deleted=True):
+            return self._delete()
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def _delete(self):
+        query = self.query
+        if (
+            query.is_sliced or query.distinct_fields or self._fields is not None
+            or query.combinator or not can_delete_by_keys(self.model)
+        ):
+            # Django raises the errors.
+            return super().delete()
+        del_query = self._chain()
+        del_query._for_write = True
+        del_query.query.select_for_update = False
+        del_query.query.select_related = False
+        if Collector(using=del_query.db).can_fast_delete(del_query) and del_query._is_single_table():
+            # One DELETE with the original WHERE.
+            return super().delete()
+        deleted = del_query._delete_by_keys()
+        self._result_cache = None
+        return deleted
+
+    def _is_single_table(self):
+        query = self.query
+        return sum(query.alias_refcount[alias] > 0 for alias in query.alias_map) <= 1
+
+    def _delete_by_keys(self):
+        names = self.model.pkplan.names
+        deleted = Counter()
+        with transaction.atomic(using=self.db, savepoint=False):
+            for keys in self.values_list(*names)._chunks_by_pk(DELETE_CHUNK_SIZE, None):
+                _, counts = CPkCollector(using=self.db).delete_keys(self.model, keys)
+                deleted.update(counts)
+        return sum(deleted.values()), dict(deleted)
 
-    def bulk_update(self, objs, fields, batch_size=None):
+    def _is_plain_query(self):
+        """
+        Whether this queryset is all the objects of the model without options,
+        so its objects can be shared by IdentityMap or fetched by the template.
+        """
+        query = self.query
+        return (
+            issubclass(self._iterable_class, ModelIterable)
+            and not query.where
+            and not query.select_related
+            and not query.deferred_loading[0]
+            and not query.annotations
+            and not query.extra
+            and not query.select_for_update
+            and not query.is_sliced
+            and not self._prefetch_related_lookups
+        )
+
+    def _expand_pk_names(self, names):
+        """
+        Replace 'pk' and the name of CompositePk with the names of the keys.
+        """
+        meta = self.model._meta
+        new_names = []
+        for name in names:
+            if self.model.has_compositepk and name in ('pk', meta.pk.name):
+                new_names.extend(key.name for key in self.model.pkeys)
+            else:
+                new_names.append(name)
+        return new_names
+
+    def bulk_create(self, objs, batch_size=None, ignore_conflicts=False,
+                    update_conflicts=False, update_fields=None, unique_fields=None):
+        """
+        Insert each of the instances into the database.
+          For update_conflicts, 'pk' in unique_fields means all keys of
+          composite primary key, and it is the default of unique_fields.
+        """
+        if not update_conflicts:
+            # keep the signature of Django < 4.1
+            return super().bulk_create(objs, batch_size=batch_size, ignore_conflicts=ignore_conflicts)
+        if self.model.has_compositepk:
+            unique_fields = self._expand_pk_names(unique_fields or ['pk'])
+        self._for_write = True
+        identitymap.invalidate(self.model)
+        with rowcache.invalidating(self.model, self.db):
+            return super().bulk_create(
+                objs,
+                batch_size=batch_size,
+                ignore_conflicts=ignore_conflicts,
+                update_conflicts=update_conflicts,
+                update_fields=update_fields,
+                unique_fields=unique_fields,
+            )
+
+    def bulk_upsert(self, objs, update_fields=None, batch_size=None):
+        """
+        Insert each of the instances, and update 'update_fields' of the rows
+        conflicting on the primary key.
+          INSERT ... ON CONFLICT (pk cols) DO UPDATE SET ...
+        'update_fields' is all fields except keys by default. If it is empty,
+        the conflicting rows are skipped(DO NOTHING).
+        Return the number of rows inserted or updated by each batch.
+        """
+        if OnConflict is None:
+            raise NotSupportedError('bulk_upsert() requires Django 4.1 or later.')
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError('Batch size must be a positive integer.')
+        objs = tuple(objs)
+        if any(obj.pk is None for obj in objs):
+            raise ValueError('All bulk_upsert() objects must have a primary key set.')
+        meta = self.model._meta
+        if update_fields is None:
+            update_fields = [f for f in meta.concrete_fields if not f.primary_key]
+        else:
+            update_fields = [meta.get_field(name) for name in update_fields]
+            if any(f.primary_key for f in update_fields):
+                raise ValueError('bulk_upsert() cannot be used with primary keys in update_fields.')
+        unique_fields = list(self.model.pkeys)
+        on_conflict = self._check_bulk_create_options(
+            not update_fields, bool(update_fields), update_fields, unique_fields,
+        )
+        if not objs:
+            return []
+        self._for_write = True
+        identitymap.invalidate(self.model)
+        connection = connections[self.db]
+        fields = meta.concrete_fields
+        max_batch_size = max(connection.ops.bulk_batch_size(fields, objs), 1)
+        batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+        counts = []
+        with rowcache.invalidating(self.model, self.db), transaction.atomic(using=self.db, savepoint=False):
+            with connection.cursor() as cursor:
+                for i in range(0, len(objs), batch_size):
+                    query = InsertQuery(
+                        self.model,
+                        on_conflict=on_conflict,
+                        update_fields=update_fields,
+                        unique_fields=unique_fields,
+                    )
+                    query.insert_values(fields, objs[i:i + batch_size])
+                    for sql, params in query.get_compiler(using=self.db).as_sql():
+                        cursor.execute(sql, params)
+                        counts.append(cursor.rowcount)
+        for obj in objs:
+            obj._state.adding = False
+            obj._state.db = self.db
+        return counts
+    bulk_upsert.alters_data = True
+
+    def bulk_delete(self, objs, batch_size=None):
+        """
+        Delete the given instances by batches of their keys.
+          Each batch is deleted by one DELETE of the keys after the cascades,
+          unless signals or relations need the instances(then collected by Collector).
+        Return the number of objects deleted and a dictionary with
+        the number of deletions per object type, like delete().
+        """
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError('Batch size must be a positive integer.')
+        objs = tuple(objs)
+        if any(obj.pk is None for obj in objs):
+            raise ValueError('All bulk_delete() objects must have a primary key set.')
+        if not objs:
+            return 0, {}
+        self._for_write = True
+        identitymap.clear()
+        batch_size = batch_size or len(objs)
+        del_query = self.order_by()
+        del_query._for_write = True
+        deleted = 0
+        rows_count = Counter()
+        # The filters of this queryset are kept by Collector.
+        by_keys = not self.query.where and can_delete_by_keys(self.model)
+        with rowcache.invalidating(self.model, self.db, deleted=True), \
+                transaction.atomic(using=del_query.db, savepoint=False):
+            for i in range(0, len(objs), batch_size):
+                keys = [obj.pkvals for obj in objs[i:i + batch_size]]
+                if by_keys:
+                    count, counts = CPkCollector(using=del_query.db).delete_keys(self.model, keys)
+                else:
+                    collector = Collector(using=del_query.db)
+                    collector.collect(del_query.filter(pk__in=keys))
+                    count, counts = collector.delete()
+                deleted += count
+                rows_count.update(counts)
+        return deleted, dict(rows_count)
+    bulk_delete.alters_data = True
+
+    def in_bulk(self, id_list=None, *, field_name='pk', batch_size=None):
+        """
+        Return a dictionary mapping each of the given IDs to the object with
+        that ID. For composite primary key, the keys of the dictionary are
+        tuples of the key values, and the IDs are queried by 'batch_size'.
+        """
+        if not (self.model.has_compositepk and field_name == 'pk'):
+            return super().in_bulk(id_list, field_name=field_name)
+        if self.query.is_sliced:
+            raise TypeError("Cannot use 'limit' or 'offset' with in_bulk().")
+        if not issubclass(self._iterable_class, ModelIterable):
+            raise TypeError('in_bulk() cannot be used with values() or values_list().')
+        if batch_size is not None and batch_size <= 0:
+            raise ValueError('Batch size must be a positive integer.')
+        if id_list is None:
+            return {obj.pkvals: obj for obj in self._chain()}
+        id_list = tuple(id_list)
+        if not id_list:
+            return {}
+        found = {}
+        imap = identitymap.get_identity_map()
+        if imap is not None and self._is_plain_query():
+            # Query only the keys not in IdentityMap.
+            misses = []
+            for id_value in id_list:
+                key = identitymap.make_key(self.model, id_value)
+                obj = None if key is None else imap.get(self.model, self.db, key)
+                if obj is None:
+                    misses.append(id_value)
+                else:
+                    found[key] = obj
+            id_list = tuple(misses)
+        else:
+            imap = None
+        if batch_size is None:
+            batch_size = self._in_bulk_batch_size(len(id_list))
+        for offset in range(0, len(id_list), batch_size):
+            batch = id_list[offset:offset + batch_size]
+            for obj in self.filter(pk__in=batch).order_by():
+                found[obj.pkvals] = obj
+                if imap is not None:
+                    imap.add(obj, self.db)
+        return found
+
+    def _in_bulk_batch_size(self, size):
+        """
+        All keys in one query by the derived table, otherwise the keys
+        within the limits of the parameters and the 'in' list, like in_bulk() of Django.
+        """
+        connection = connections[self.db]
+        max_params = connection.features.max_query_params
+        if not max_params:
+            return max(size, 1)
+        batch_size = max(max_params // len(self.model.pkeys), 1)
+        max_in_list_size = connection.ops.max_in_list_size()
+        if max_in_list_size:
+            batch_size = min(batch_size, max_in_list_size)
+        if size <= batch_size or supports_derived_in(connection):
+            return max(size, 1)
+        return batch_size
+
+    def fetch(self, pk, fields=None):
+        """
+        Return the object of 'pk' like get(pk=pk), by the SELECT compiled once
+        for the model, the database and 'fields'(names of the fields to load,
+        all the fields by default). Only the key values are bound for each call.
+        The queryset with any filters or options is fetched by get().
+        """
+        fields = tuple(fields) if fields else None
+        key = identitymap.make_key(self.model, pk)
+        if key is None or not self._is_plain_query():
+            return self._fetch_by_query(fields).get(pk=pk)
+        imap = identitymap.get_identity_map() if fields is None else None
+        if imap is not None:
+            obj = imap.get(self.model, self.db, key)
+            if obj is not None:
+                return obj
+        objs = self._fetch([key], fields)
+        if not objs:
+            raise self.model.DoesNotExist(
+                '%s matching query does not exist.' % self.model._meta.object_name
+            )
+        if imap is not None:
+            imap.add(objs[0], self.db)
+        return objs[0]
+
+    def fetch_many(self, pks, fields=None):
+        """
+        Return a dictionary mapping each of 'pks' to the object like in_bulk(),
+        by one query of the template of fetch() with the multi-column 'in'.
+        """
+        fields = tuple(fields) if fields else None
+        if not self._is_plain_query():
+            return self._fetch_by_query(fields).in_bulk(pks)
+        keys = []
+        for pk in pks:
+            key = identitymap.make_key(self.model, pk)
+            if key is None:
+                # Raise the same error as in_bulk().
+                return self._fetch_by_query(fields).in_bulk(pks)
+            keys.append(key)
+        keys = list(dict.fromkeys(keys))
+        if not keys:
+            return {}
+        if self.model.has_compositepk:
+            return {obj.pkvals: obj for obj in self._fetch(keys, fields)}
+        return {obj.pk: obj for obj in self._fetch(keys, fields)}
+
+    def _fetch_by_query(self, fields):
+        if fields is None:
+            return self
+        return self.only(*self.model.pkplan.names, *fields)
+
+    def _fetch(self, keys, fields):
+        connection = connections[self.db]
+        template = get_fetch_template(self.model, connection, fields)
+        key_fields = self.model.pkeys
+        if len(keys) == 1:
+            sql = template.exact_sql
+            params = [
+                field.get_db_prep_value(val, connection, prepared=True)
+                for field, val in zip(key_fields, keys[0])
+            ]
+        else:
+            where_sql, params, _ = compile_in(template.cols, key_fields, keys, connection)
+            sql = '%s WHERE %s' % (template.select_sql, where_sql)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            rows = cursor.fetchall()
+        objs = []
+        for row in rows:
+            if template.converters:
+                row = list(row)
+                for pos, (converters, expression) in template.converters.items():
+                    value = row[pos]
+                    for converter in converters:
+                        value = converter(value, expression, connection)
+                    row[pos] = value
+            objs.append(self.model.from_db(self.db, template.attnames, row))
+        return objs
+
+    def rows(self, *fields):
+        """
+        Return the records of the rows instead of the model instances.
+          Each record is a namedtuple of 'key'(the tuple of the key values)
+          and 'fields'(all the concrete fields by default), built without
+          the model instances. So it's light for reading many rows.
+        Ex.
+            for row in Album.objects.rows('name').iter_by_pk():
+                print(row.key, row.name)
+        """
+        fields = self._row_field_names(fields)
+        if 'key' in fields:
+            raise ValueError("rows() can't have the field named 'key'.")
+        plan = get_row_plan(self.model, fields)
+        clone = self.values_list(*plan.select)
+        clone._iterable_class = RowIterable
+        clone._row_fields = fields
+        return clone
+
+    def _row_field_names(self, fields):
+        if fields:
+            return tuple(self._expand_pk_names(fields))
+        return tuple(f.attname for f in self.model._meta.concrete_fields)
+
+    def export(self, fp, format='csv', fields=None, chunk_size=EXPORT_CHUNK_SIZE, start=None, checkpoint=None):
+        """
+        Write the rows to the text file 'fp' in the order of the primary keys,
+        by the chunks of iter_by_pk(), so the queryset is never loaded at once.
+        Return the number of the rows written and the last key.
+          format     : 'csv' or 'ndjson'(a JSON object for each line).
+          fields     : names of the fields(all the concrete fields by default).
+          start      : the key to resume after(the last key of the interrupted export).
+                       The header of CSV is written only if it's None.
+          checkpoint : called with the last key and the number of the rows
+                       written after each chunk is flushed.
+        Ex.
+            with open('album.csv', 'a', newline='') as fp:
+                Album.objects.export(fp, start=last_key, checkpoint=save_checkpoint)
+        """
+        fields = self._row_field_names(fields)
+        writer = export.get_writer(format, fp, fields)
+        select, positions = select_keys_first(self.model, fields)
+        if positions == list(range(len(select))):
+            project = None
+        elif len(positions) == 1:
+            pos = positions[0]
+            project = lambda row: (row[pos],)
+        else:
+            project = itemgetter(*positions)
+        chunks = self.values_list(*select)._chunks_by_pk(chunk_size, start)
+        num_keys = len(self.model.pkplan.keys)
+        flush = getattr(fp, 'flush', None)
+        if start is None:
+            writer.write_header()
+        count = 0
+        key = start
+        for chunk in chunks:
+            writer.write_rows(chunk if project is None else map(project, chunk))
+            if flush is not None:
+                flush()
+            count += len(chunk)
+            key = chunk[-1][:num_keys]
+            if checkpoint is not None:
+                checkpoint(key, count)
+        return count, key
+
+    def after(self, pk, inclusive=False):
+        """
+        Return the objects after 'pk' in the order of the primary keys.
+          It's for keyset(seek) pagination, compiled to '(a,b) > (%s,%s)'
+          or its expanded form 'a >= %s AND (a > %s OR (a = %s AND b > %s))'.
+        """
+        return self._seek('gte' if inclusive else 'gt', pk).order_by('pk')
+
+    def before(self, pk, inclusive=False):
+        """
+        Return the objects before 'pk' in the descending order of the primary keys.
+        """
+        return self._seek('lte' if inclusive else 'lt', pk).order_by('-pk')
+
+    def _seek(self, lookup, pk):
+        if not self.model.has_compositepk and isinstance(pk, (tuple, list)):
+            # key tuple of the single primary key
+            pk, = pk
+        return self.filter(**{'pk' + LOOKUP_SEP + lookup: pk})
+
+    def iter_by_pk(self, chunk_size=1000, start=None):
+        """
+        Iterate over the objects in the order of the primary keys by chunks.
+          Each chunk is one short query seeking from the last key of the
+          previous chunk, so neither server-side cursor nor OFFSET is used.
+          start : the key to resume after(e.g. the pkvals of the last object processed).
+        The rows of values()/values_list() are also available if they have the keys.
+        """
+        for chunk in self._chunks_by_pk(chunk_size, start):
+            yield from chunk
+
+    def _chunks_by_pk(self, chunk_size, start):
+        if chunk_size <= 0:
+            raise ValueError('Chunk size must be strictly positive.')
+        if self.query.is_sliced:
+            raise TypeError("Cannot use 'limit' or 'offset' with iter_by_pk().")
+        get_key = self._row_key_getter()
+        queryset = self.order_by('pk')
+        key = start
+        while True:
+            chunk_qs = queryset if key is None else queryset._seek('gt', key)
+            chunk = list(chunk_qs[:chunk_size])
+            if chunk:
+                yield chunk
+            if len(chunk) < chunk_size:
+                return
+            key = get_key(chunk[-1])
+
+    def _row_key_getter(self):
+        """ Return the function to get the key tuple from a result row. """
+        plan = self.model.pkplan
+        if issubclass(self._iterable_class, ModelIterable):
+            return plan.getter
+        if issubclass(self._iterable_class, RowIterable):
+            return attrgetter('key')
+        if self._fields:
+            fields = list(self._fields)
+        else:
+            meta = self.model._meta
+            fields = [f.attname for f in meta.concrete_fields]
+            fields += list(self.query.extra_select) + list(self.query.annotation_select)
+        positions = []
+        for key in plan.keys:
+            name = key.name if key.name in fields else key.attname
+            if name not in fields:
+                raise TypeError('iter_by_pk() requires the primary keys in the values.')
+            positions.append(name if issubclass(self._iterable_class, ValuesIterable) else fields.index(name))
+        if issubclass(self._iterable_class, FlatValuesListIterable):
+            return lambda row: (row,)
+        return lambda row: tuple(row[pos] for pos in positions)
+
+    def bulk_update(self, objs, fields, batch_size=None, use_join=True):
         """
         Update the given fields in each of the given objects in the database.
+          use_join : update by one statement joined with the new values
+                     if the backend supports it, otherwise by CASE/WHEN.
         """
         if batch_size is not None and batch_size < 0:
             raise ValueError('Batch size must be a positive integer.')
@@ -186,12 +872,20 @@ class CPkQuerySet(QuerySet):
         if any(f.primary_key for f in fields):
             raise ValueError('bulk_update() cannot be used with primary key fields.')
         if not objs:
-            return
-        # PK is used twice in the resulting update query, once in the filter
-        # and once in the WHEN. Each field will also have one CAST.
-        max_batch_size = connections[self.db].ops.bulk_batch_size(['pk', 'pk'] + fields, objs)
+            return 0
+        self._for_write = True
+        identitymap.invalidate(self.model)
+        with rowcache.invalidating(self.model, self.db):
+            return self._bulk_update(objs, fields, batch_size, use_join)
+    bulk_update.alters_data = True
+
+    def _bulk_update(self, objs, fields, batch_size, use_join):
+        connection = connections[self.db]
+        if use_join and self._can_update_by_join(connection, objs, fields):
+            return self._update_by_join(connection, objs, fields, batch_size)
+        max_batch_size = connection.ops.bulk_batch_size(self._case_update_params(fields), objs)
         batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
-        requires_casting = connections[self.db].features.requires_casted_case_in_updates
+        requires_casting = connection.features.requires_casted_case_in_updates
         batches = (objs[i:i + batch_size] for i in range(0, len(objs), batch_size))
         updates = []
         for batch_objs in batches:
@@ -211,8 +905,153 @@ class CPkQuerySet(QuerySet):
                 if requires_casting:
                     case_statement = Cast(case_statement, output_field=field)
                 update_kwargs[field.attname] = case_statement
-            updates.append(([obj.pk for obj in batch_objs], update_kwargs))
-        with transaction.atomic(using=self.db, savepoint=False):
+            # The key tuples, never the pk joined by CPK_SEP(the values may contain it).
+            if self.model.has_compositepk:
+                pks = [obj.pkvals for obj in batch_objs]
+            else:
+                pks = [obj.pk for obj in batch_objs]
+            updates.append((pks, update_kwargs))
+        rows_updated = 0
+        timer = instrumentation.timer(
+            'bulk_update', self.model, method='case', batches=len(updates), rows=len(objs),
+        )
+        with timer, transaction.atomic(using=self.db, savepoint=False):
             for pks, update_kwargs in updates:
-                self.filter(pk__in=pks).update(**update_kwargs)
-    bulk_update.alters_data = True
+                rows_updated += self.filter(pk__in=pks).update(**update_kwargs)
+        return rows_updated
+
+    def _case_update_params(self, fields):
+        """
+        Fields of the parameters bound for each object by the CASE/WHEN update.
+          All key columns are used once in the filter, and once with
+          the new value in the WHEN of each field.
+        """
+        keys = list(self.model.pkeys)
+        return keys + [f for field in fields for f in keys + [field]]
+
+    ###########################
+    # async
+    ###########################
+    #   MEMO: Each method runs the sync version in one sync_to_async() call,
+    #           so the composite operation(batches, rewrites of the keys, etc.)
+    #           is done in one switch of the thread.
+
+    async def aget(self, *args, **kwargs):
+        return await sync_to_async(self.get)(*args, **kwargs)
+
+    async def ain_bulk(self, id_list=None, *, field_name='pk', batch_size=None):
+        return await sync_to_async(self.in_bulk)(id_list, field_name=field_name, batch_size=batch_size)
+
+    async def abulk_update(self, objs, fields, batch_size=None, use_join=True):
+        return await sync_to_async(self.bulk_update)(objs, fields, batch_size=batch_size, use_join=use_join)
+    abulk_update.alters_data = True
+
+    async def abulk_upsert(self, objs, update_fields=None, batch_size=None):
+        return await sync_to_async(self.bulk_upsert)(objs, update_fields=update_fields, batch_size=batch_size)
+    abulk_upsert.alters_data = True
+
+    async def abulk_delete(self, objs, batch_size=None):
+        return await sync_to_async(self.bulk_delete)(objs, batch_size=batch_size)
+    abulk_delete.alters_data = True
+
+    async def adelete(self):
+        return await sync_to_async(self.delete)()
+    adelete.alters_data = True
+    adelete.queryset_only = True
+
+    async def aupdate(self, **kwargs):
+        return await sync_to_async(self.update)(**kwargs)
+    aupdate.alters_data = True
+
+    async def aiter_by_pk(self, chunk_size=1000, start=None):
+        """
+        Asynchronous version of iter_by_pk().
+          Each chunk is read in one sync_to_async() call.
+        Ex.
+            async for album in Album.objects.aiter_by_pk(chunk_size=2000):
+                ...
+        """
+        chunks = self._chunks_by_pk(chunk_size, start)
+        while True:
+            chunk = await sync_to_async(next)(chunks, None)
+            if chunk is None:
+                return
+            for obj in chunk:
+                yield obj
+
+    ###########################
+    # bulk_update by join
+    ###########################
+
+    def _can_update_by_join(self, connection, objs, fields):
+        """
+        UPDATE ... FROM (VALUES ...) is available ?
+        """
+        if connection.vendor == 'postgresql':
+            pass
+        elif connection.vendor == 'sqlite':
+            # UPDATE-FROM is supported from SQLite 3.33.0
+            if connection.Database.sqlite_version_info < (3, 33, 0):
+                return False
+        else:
+            return False
+        if self.query.where:
+            # keep the filters of this queryset by the CASE path.
+            return False
+        meta = self.model._meta
+        if any(f.model._meta.concrete_model != meta.concrete_model for f in fields):
+            return False
+        return not any(
+            isinstance(getattr(obj, f.attname), Expression) for obj in objs for f in fields
+        )
+
+    def _update_by_join(self, connection, objs, fields, batch_size):
+        """
+        Update all fields of a batch by one statement joined with the new values
+        on all primary key columns.
+          UPDATE t SET f = v.f FROM (VALUES (%s,%s,%s),...) AS v (a,b,f)
+                 WHERE t.a = v.a AND t.b = v.b
+        """
+        qn = connection.ops.quote_name
+        keys = self.model.pkeys
+        columns = list(keys) + list(fields)
+        max_batch_size = connection.ops.bulk_batch_size(columns, objs)
+        batch_size = min(batch_size, max_batch_size) if batch_size else max_batch_size
+        table = qn(self.model._meta.db_table)
+        names = [qn(f.column) for f in columns]
+        set_sql = ", ".join("%s = v.%s" % (qn(f.column), qn(f.column)) for f in fields)
+        where_sql = " AND ".join(
+            "%s.%s = v.%s" % (table, qn(column), qn(column)) for column in self.model.pkplan.columns
+        )
+        if connection.vendor == 'postgresql':
+            placeholder = "(%s)" % ", ".join("%%s::%s" % f.db_type(connection) for f in columns)
+        else:
+            placeholder = "(%s)" % ", ".join(["%s"] * len(columns))
+        rows_updated = 0
+        timer = instrumentation.timer(
+            'bulk_update', self.model, method='join',
+            batches=(len(objs) + batch_size - 1) // batch_size, rows=len(objs),
+        )
+        with timer, transaction.atomic(using=self.db, savepoint=False):
+            with connection.cursor() as cursor:
+                for i in range(0, len(objs), batch_size):
+                    batch_objs = objs[i:i + batch_size]
+                    values_sql = "VALUES %s" % ", ".join([placeholder] * len(batch_objs))
+                    if connection.vendor == 'postgresql':
+                        from_sql = "(%s) AS v (%s)" % (values_sql, ", ".join(names))
+                    else:
+                        # SQLite names VALUES columns as column1, column2, ...
+                        aliases = ", ".join("column%d AS %s" % (no, name) for no, name in enumerate(names, 1))
+                        from_sql = "(SELECT %s FROM (%s)) AS v" % (aliases, values_sql)
+                    sql = "UPDATE %s SET %s FROM %s WHERE %s" % (table, set_sql, from_sql, where_sql)
+                    params = [
+                        f.get_db_prep_save(getattr(obj, f.attname), connection)
+                        for obj in batch_objs for f in columns
+                    ]
+                    cursor.execute(sql, params)
+                    rows_updated += cursor.rowcount
+        return rows_updated
+
+
+class CPkManager(BaseManager.from_queryset(CPkQuerySet)):
+    pass
@@ -0,0 +1,103 @@
+"""
+Deletion of CPkModel rows by the key tuples, without fetching the instances.
+"""
+
+from collections import Counter, defaultdict
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import DO_NOTHING, signals
+from django.db.models.deletion import Collector, get_candidate_relations_to_delete
+
+try:
+    from django.db.models import RESTRICT
+    from django.db.models.deletion import RestrictedError
+except ImportError:
+    # Django < 3.1
+    RESTRICT = RestrictedError = None
+
+
+def can_delete_by_keys(model):
+    """
+    Whether the rows of 'model' can be deleted by the key tuples.
+      The instances are required by the signal receivers, the parents,
+      the generic relations, RESTRICT and the relations not to the keys.
+    """
+    meta = model._meta
+    if not getattr(model, 'has_compositepk', False) or meta.parents:
+        return False
+    if signals.pre_delete.has_listeners(model) or signals.post_delete.has_listeners(model):
+        return False
+    if any(hasattr(field, 'bulk_related_objects') for field in meta.private_fields):
+        return False
+    keys = list(model.pkeys)
+    for related in get_candidate_relations_to_delete(meta):
+        field = related.field
+        on_delete = field.remote_field.on_delete
+        if on_delete == DO_NOTHING:
+            continue
+        if on_delete == RESTRICT or list(field.foreign_related_fields) != keys:
+            return False
+    return True
+
+
+class CPkCollector(Collector):
+    """
+    Collector of the rows of CPkModel given by the key tuples.
+      The related rows are filtered by the keys, and fast-deleted if possible,
+      otherwise collected by Collector. Then the rows of the keys are deleted
+      by one DELETE. Use it only if can_delete_by_keys(model).
+    """
+    def collect_keys(self, model, keys):
+        for related in get_candidate_relations_to_delete(model._meta):
+            field = related.field
+            on_delete = field.remote_field.on_delete
+            if on_delete == DO_NOTHING:
+                continue
+            sub_objs = self.related_objects(related.related_model, [field], keys)
+            if self.can_fast_delete(sub_objs, from_field=field):
+                self.fast_deletes.append(sub_objs)
+            elif getattr(on_delete, 'lazy_sub_objs', False) or sub_objs:
+                on_delete(self, field, sub_objs, self.using)
+        if RestrictedError is not None:
+            self.check_restricted(model)
+
+    def check_restricted(self, model):
+        """
+        Raise RestrictedError if the objects referenced through RESTRICT
+        (collected by the cascades) aren't deleted, like Collector.collect().
+        """
+        for related_model, instances in self.data.items():
+            self.clear_restricted_objects_from_set(related_model, instances)
+        for qs in self.fast_deletes:
+            self.clear_restricted_objects_from_queryset(qs.model, qs)
+        restricted_objects = defaultdict(list)
+        for related_model, fields in self.restricted_objects.items():
+            for field, objs in fields.items():
+                if objs:
+                    key = "'%s.%s'" % (related_model.__name__, field.name)
+                    restricted_objects[key] += objs
+        if restricted_objects:
+            raise RestrictedError(
+                "Cannot delete some instances of model %r because "
+                "they are referenced through restricted foreign keys: %s." % (
+                    model.__name__, ", ".join(restricted_objects),
+                ),
+                set(chain.from_iterable(restricted_objects.values())),
+            )
+
+    def delete_keys(self, model, keys):
+        """
+        Delete the rows of 'keys' and the cascades.
+        Return the number of rows deleted and a dictionary with
+        the number of deletions per model, like delete().
+        """
+        self.collect_keys(model, keys)
+        with transaction.atomic(using=self.using, savepoint=False):
+            _, counts = self.delete()
+            # The related rows are deleted(or updated) before.
+            count = model._base_manager.using(self.using).filter(pk__in=keys)._raw_delete(self.using)
+        counts = Counter(counts)
+        if count:
+            counts[model._meta.label] += count
+        return sum(counts.values()), dict(counts)
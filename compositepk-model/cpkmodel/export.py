@@ -0,0 +1,73 @@
+"""
+Writers of the rows exported by CPkQuerySet.export().
+"""
+
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+
+class CsvWriter:
+    """ Write the rows as CSV, the names of the fields in the header. """
+    def __init__(self, fp, fields):
+        self.writer = csv.writer(fp)
+        self.fields = fields
+
+    def write_header(self):
+        self.writer.writerow(self.fields)
+
+    def write_rows(self, rows):
+        self.writer.writerows(rows)
+
+
+class NdjsonWriter:
+    """ Write each row as a JSON object in a line, encoded by DjangoJSONEncoder. """
+    def __init__(self, fp, fields):
+        self.fp = fp
+        self.fields = fields
+        self.encode = DjangoJSONEncoder(ensure_ascii=False).encode
+
+    def write_header(self):
+        pass
+
+    def write_rows(self, rows):
+        encode, fields = self.encode, self.fields
+        self.fp.write(''.join(['%s\n' % encode(dict(zip(fields, row))) for row in rows]))
+
+
+WRITERS = {
+    'csv': CsvWriter,
+    'ndjson': NdjsonWriter,
+}
+
+
+def get_writer(format, fp, fields):
+    try:
+        writer_class = WRITERS[format]
+    except KeyError:
+        raise ValueError(
+            "Unknown export format %r. Choose from %s." % (format, ', '.join(sorted(WRITERS)))
+        ) from None
+    return writer_class(fp, fields)
+
+
+def load_checkpoint(model, data):
+    """
+    Return the key tuple of the checkpoint 'data'(loaded from JSON),
+    typed by each key field.
+    """
+    return tuple(
+        None if val is None else key.to_python(val)
+        for key, val in zip(model.pkeys, data['key'])
+    )
+
+
+def dump_checkpoint(key, rows, offset=None):
+    """
+    Return the checkpoint as a JSON string.
+      key    : the last key exported.
+      rows   : the number of the rows exported.
+      offset : the position of the output flushed with the last key.
+    """
+    return json.dumps({'key': key, 'rows': rows, 'offset': offset}, cls=DjangoJSONEncoder)
@@ -0,0 +1,150 @@
+"""
+Identity map of CPkModel instances, scoped by a request or a context manager.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:
+    # asgiref < 3.6
+    import asyncio
+    from asyncio import iscoroutinefunction
+
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine
+        return func
+
+from django.core.exceptions import ValidationError
+from django.db.models import Model
+from django.db.models.signals import post_save
+
+from .lookups import prep_key_value, separate_value
+
+_current_map = ContextVar('cpkmodel_identity_map', default=None)
+
+
+class IdentityMap:
+    """
+    Instances of CPkModel keyed by the tuples of the key values.
+      get(pk=...) and in_bulk() of CPkQuerySet are served from this map.
+      The entries of a model are invalidated by save, update and bulk_update
+      of the model, and all the entries by delete(for cascades).
+    """
+    def __init__(self):
+        self._models = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return sum(len(objs) for objs in self._models.values())
+
+    @property
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self)}
+
+    def get(self, model, using, key):
+        obj = self._models.get((model._meta.label, using), {}).get(key)
+        if obj is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return obj
+
+    def add(self, obj, using):
+        objs = self._models.setdefault((obj._meta.label, using), {})
+        objs[obj.pkvals] = obj
+
+    def invalidate(self, model):
+        label = model._meta.label
+        for model_key in [model_key for model_key in self._models if model_key[0] == label]:
+            del self._models[model_key]
+
+    def clear(self):
+        self._models.clear()
+
+
+def get_identity_map():
+    """ Return the active IdentityMap, or None. """
+    return _current_map.get()
+
+
+@contextmanager
+def identity_map():
+    """
+    Activate a new IdentityMap in the block.
+    Ex.
+        with identity_map() as imap:
+            branch = CompanyBranch.objects.get(pk=(1,'JP'))
+            branch = CompanyBranch.objects.get(pk=(1,'JP'))   # no query
+        print(imap.stats)
+    """
+    imap = IdentityMap()
+    token = _current_map.set(imap)
+    try:
+        yield imap
+    finally:
+        _current_map.reset(token)
+
+
+def invalidate(model):
+    imap = _current_map.get()
+    if imap is not None:
+        imap.invalidate(model)
+
+
+def clear():
+    imap = _current_map.get()
+    if imap is not None:
+        imap.clear()
+
+
+def make_key(model, value):
+    """
+    Return the key tuple of 'value'(pk, tuple, or the values joined by CPK_SEP)
+    prepared by the key fields, or None if it isn't a key of the model.
+    """
+    if isinstance(value, Model):
+        return value.pkvals if isinstance(value, model) else None
+    keys = model.pkeys
+    vals = tuple(separate_value(value)) if model.has_compositepk else (value,)
+    if len(vals) != len(keys):
+        return None
+    try:
+        return tuple(prep_key_value(key, val) for key, val in zip(keys, vals))
+    except (TypeError, ValueError, ValidationError):
+        return None
+
+
+def _invalidate_saved(sender, **kwargs):
+    if _current_map.get() is not None and hasattr(sender, 'pkplan'):
+        invalidate(sender)
+
+
+post_save.connect(_invalidate_saved, dispatch_uid='cpkmodel_identity_map')
+
+
+class IdentityMapMiddleware:
+    """
+    Activate an IdentityMap for each request. It's set to request.identity_map.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with identity_map() as imap:
+            request.identity_map = imap
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with identity_map() as imap:
+            request.identity_map = imap
+            return await self.get_response(request)
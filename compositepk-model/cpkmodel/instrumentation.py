@@ -0,0 +1,116 @@
+"""
+Instrumentation of the composite-key rewrites and the compiled lookups.
+"""
+
+import time
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.dispatch import Signal
+
+# Sent for each event while any receiver is connected.
+#   sender  : the model(or None)
+#   event   : 'transform_q', 'names_to_path', 'composite_col', 'in' or 'bulk_update'
+#   elapsed : seconds of the event(or None)
+#   others  : keys and strategy of 'in', method, batches and rows of 'bulk_update'
+cpk_event = Signal()
+
+_current_stats = ContextVar('cpkmodel_stats', default=None)
+
+
+class CPkStats:
+    """
+    Counters and timings of the events collected in collect_stats().
+      counts        : {event: number of the events}
+      timings       : {event: total seconds}
+      in_keys       : number of the keys of each multi-column 'in'
+      in_strategies : {strategy: number of multi-column 'in'}
+      batches       : {method of bulk_update('join' or 'case'): number of the batches}
+    """
+    def __init__(self):
+        self.counts = Counter()
+        self.timings = defaultdict(float)
+        self.in_keys = []
+        self.in_strategies = Counter()
+        self.batches = Counter()
+
+    def record(self, event, elapsed=None, **info):
+        self.counts[event] += 1
+        if elapsed is not None:
+            self.timings[event] += elapsed
+        if event == 'in':
+            self.in_keys.append(info['keys'])
+            self.in_strategies[info['strategy']] += 1
+        elif event == 'bulk_update':
+            self.batches[info['method']] += info['batches']
+
+    def as_dict(self):
+        return {
+            'counts': dict(self.counts),
+            'timings': dict(self.timings),
+            'in_keys': list(self.in_keys),
+            'in_strategies': dict(self.in_strategies),
+            'batches': dict(self.batches),
+        }
+
+
+@contextmanager
+def collect_stats():
+    """
+    Collect the events in the block to CPkStats.
+    Ex.
+        with collect_stats() as stats:
+            list(Album.objects.filter(pk__in=keys))
+        print(stats.timings['transform_q'], stats.in_strategies)
+    """
+    stats = CPkStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def enabled():
+    return _current_stats.get() is not None or bool(cpk_event.receivers)
+
+
+def record(event, model=None, elapsed=None, **info):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.record(event, elapsed, **info)
+    if cpk_event.receivers:
+        cpk_event.send(sender=model, event=event, elapsed=elapsed, **info)
+
+
+class _Timer:
+    def __init__(self, event, model, info):
+        self.event = event
+        self.model = model
+        self.info = info
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        record(self.event, self.model, time.perf_counter() - self.start, **self.info)
+
+
+class _NoTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        pass
+
+
+_no_timer = _NoTimer()
+
+
+def timer(event, model=None, **info):
+    """ Context manager to record the event with the elapsed time, if enabled. """
+    if not enabled():
+        return _no_timer
+    return _Timer(event, model, info)
@@ -0,0 +1,316 @@
+"""
+Lookups for CompositeKey(Multi-Column).
+"""
+
+import json
+
+from django.core.exceptions import EmptyResultSet
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Lookup
+from django.db.models.fields.related_lookups import (
+    RelatedExact,
+    RelatedGreaterThan,
+    RelatedGreaterThanOrEqual,
+    RelatedIn,
+    RelatedLessThan,
+    RelatedLessThanOrEqual,
+    get_normalized_value,
+)
+try:
+    from django.db.models.expressions import ColPairs as MultiColSource
+except ImportError:
+    # Django < 5.2
+    from django.db.models.fields.related_lookups import MultiColSource
+
+from . import instrumentation
+from .constants import (
+    CPK_SEP,
+    IN_ROW_VALUE,
+    IN_EXPANDED,
+    IN_DERIVED,
+    IN_DERIVED_THRESHOLD,
+)
+
+# Backends which accept "(a,b) IN ((%s,%s),...)".
+ROW_VALUE_IN_VENDORS = ('postgresql', 'mysql', 'oracle')
+
+# Backends which accept "(a,b) > (%s,%s)".
+ROW_VALUE_COMPARE_VENDORS = ('postgresql', 'mysql')
+
+# Operators of the comparison lookups: (operator, operator of the last column)
+COMPARE_OPERATORS = {
+    'gt': ('>', '>'),
+    'gte': ('>', '>='),
+    'lt': ('<', '<'),
+    'lte': ('<', '<='),
+}
+
+
+class CPkStr(str):
+    """
+    pk of CPkModel, the key values joined by CPK_SEP.
+      It keeps the key tuple, so the lookups by the pk(e.g. '<pk>__in' of
+      Collector) use the key values, even if they contain CPK_SEP.
+    """
+    def __new__(cls, vals):
+        self = super().__new__(cls, CPK_SEP.join(str(val) for val in vals))
+        self.vals = tuple(vals)
+        return self
+
+    def __reduce__(self):
+        return (self.__class__, (self.vals,))
+
+
+def separate_value(value):
+    """ Separate the value of composite key, joined by CPK_SEP(pk of CPkModel). """
+    if isinstance(value, CPkStr):
+        return value.vals
+    if isinstance(value, str):
+        return value.split(CPK_SEP)
+    return value
+
+
+def prep_key_value(key, value):
+    """ Prepare one value of a composite key for the lookup. """
+    if key.is_relation and hasattr(value, '_meta'):
+        # Model instance for ForeignKey
+        value = getattr(value, key.target_field.attname)
+    return key.get_prep_value(value)
+
+
+def supports_derived_in(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    elif connection.vendor == 'sqlite':
+        # json_each() is provided by JSON1 extension.
+        return connection.features.supports_json_field
+    else:
+        return False
+
+
+def get_in_strategy(connection, size, width):
+    """
+    Choose the strategy for 'in' lookup with 'size' keys of 'width' columns.
+    """
+    max_params = connection.features.max_query_params
+    if size > IN_DERIVED_THRESHOLD or (max_params and size * width > max_params):
+        if supports_derived_in(connection):
+            return IN_DERIVED
+    if connection.vendor in ROW_VALUE_IN_VENDORS:
+        return IN_ROW_VALUE
+    else:
+        return IN_EXPANDED
+
+
+def compile_in(cols, keys, rows, connection):
+    """
+    Make sql for multi-column 'in'.
+        cols : compiled sql of each column.
+        keys : key fields of each column.
+        rows : tuples of prepared values.
+    Return (sql, params, strategy).
+    """
+    if not rows:
+        raise EmptyResultSet
+    rows = [
+        tuple(key.get_db_prep_value(val, connection, prepared=True) for key, val in zip(keys, row))
+        for row in rows
+    ]
+    strategy = get_in_strategy(connection, len(rows), len(cols))
+    lhs = "(%s)" % ", ".join(cols)
+    if strategy == IN_DERIVED:
+        if connection.vendor == 'postgresql':
+            # (a,b) IN (SELECT * FROM UNNEST(%s::type_a[], %s::type_b[]))
+            arrays = ", ".join("%%s::%s[]" % key.db_type(connection) for key in keys)
+            sql = "%s IN (SELECT * FROM UNNEST(%s))" % (lhs, arrays)
+            params = [list(vals) for vals in zip(*rows)]
+        else:
+            # (a,b) IN (SELECT json_extract(value, '$[0]'), ... FROM json_each(%s))
+            items = ", ".join("json_extract(value, '$[%d]')" % i for i in range(len(cols)))
+            sql = "%s IN (SELECT %s FROM json_each(%%s))" % (lhs, items)
+            params = [json.dumps(rows, cls=DjangoJSONEncoder)]
+    elif strategy == IN_ROW_VALUE:
+        row_sql = "(%s)" % ", ".join(["%s"] * len(cols))
+        sql = "%s IN (%s)" % (lhs, ", ".join([row_sql] * len(rows)))
+        params = [val for row in rows for val in row]
+    else:
+        row_sql = "(%s)" % " AND ".join("%s = %%s" % col for col in cols)
+        sql = "(%s)" % " OR ".join([row_sql] * len(rows))
+        params = [val for row in rows for val in row]
+    instrumentation.record('in', keys[0].model, keys=len(rows), strategy=strategy)
+    return sql, params, strategy
+
+
+def compile_compare(cols, keys, row, lookup_name, connection):
+    """
+    Make sql for multi-column comparison in the lexicographic order.
+        cols : compiled sql of each column.
+        keys : key fields of each column.
+        row  : tuple of prepared values.
+    Ex. 'gt' for (a,b,c)
+        row value : (a, b, c) > (%s, %s, %s)
+        expanded  : a >= %s AND (a > %s OR (a = %s AND (b > %s OR (b = %s AND c > %s))))
+    """
+    row = [key.get_db_prep_value(val, connection, prepared=True) for key, val in zip(keys, row)]
+    op, last_op = COMPARE_OPERATORS[lookup_name]
+    if connection.vendor in ROW_VALUE_COMPARE_VENDORS:
+        sql = "(%s) %s (%s)" % (", ".join(cols), last_op, ", ".join(["%s"] * len(cols)))
+        return sql, row
+    sql = "%s %s %%s" % (cols[-1], last_op)
+    params = [row[-1]]
+    for col, val in zip(reversed(cols[:-1]), reversed(row[:-1])):
+        sql = "(%s %s %%s OR (%s = %%s AND %s))" % (col, op, col, sql)
+        params = [val, val] + params
+    if len(cols) > 1:
+        # The range of the first column, for the index range scan.
+        sql = "%s %s= %%s AND %s" % (cols[0], op, sql)
+        params = [row[0]] + params
+    return sql, params
+
+
+class CompositeIn(Lookup):
+    """
+    'in' lookup for CompositeKey.
+      The rhs is a list of value tuples, compiled with the strategy
+      fit for the backend and the number of keys.
+    """
+    lookup_name = 'in'
+
+    def get_prep_lookup(self):
+        keys = self.lhs.target.keys
+        rows = []
+        for vals in self.rhs:
+            vals = tuple(separate_value(vals))
+            if len(vals) != len(keys):
+                raise ValueError("Parameter unmatch : key={} val={}".format(self.lhs.target.names, vals))
+            rows.append(tuple(prep_key_value(key, val) for key, val in zip(keys, vals)))
+        # Remove duplicates, and NULL is never equal to anything.
+        return [row for row in dict.fromkeys(rows) if None not in row]
+
+    def as_sql(self, compiler, connection):
+        cols = self.lhs.compile_cols(compiler)
+        sql, params, _ = compile_in(cols, self.lhs.target.keys, self.rhs, connection)
+        return sql, params
+
+
+class CompositeCompare(Lookup):
+    """
+    Comparison lookups for CompositeKey in the lexicographic order of the keys.
+      The rhs is a tuple of values, or the values joined by CPK_SEP.
+    """
+    def get_prep_lookup(self):
+        keys = self.lhs.target.keys
+        vals = tuple(separate_value(self.rhs))
+        if len(vals) != len(keys):
+            raise ValueError("Parameter unmatch : key={} val={}".format(self.lhs.target.names, vals))
+        return tuple(prep_key_value(key, val) for key, val in zip(keys, vals))
+
+    def as_sql(self, compiler, connection):
+        cols = self.lhs.compile_cols(compiler)
+        return compile_compare(cols, self.lhs.target.keys, self.rhs, self.lookup_name, connection)
+
+
+class CompositeGreaterThan(CompositeCompare):
+    lookup_name = 'gt'
+
+
+class CompositeGreaterThanOrEqual(CompositeCompare):
+    lookup_name = 'gte'
+
+
+class CompositeLessThan(CompositeCompare):
+    lookup_name = 'lt'
+
+
+class CompositeLessThanOrEqual(CompositeCompare):
+    lookup_name = 'lte'
+
+
+def related_key_row(lhs, value):
+    """ Return the prepared values of a multi-column relation for the lookup. """
+    if isinstance(value, str):
+        value = tuple(separate_value(value))
+    row = get_normalized_value(value, lhs)
+    if len(row) != len(lhs.targets):
+        raise ValueError("Parameter unmatch : key={} val={}".format([f.name for f in lhs.targets], row))
+    return tuple(target.get_prep_value(val) for target, val in zip(lhs.targets, row))
+
+
+def compile_related_cols(lhs, compiler):
+    return [
+        compiler.compile(target.get_col(lhs.alias, source))[0]
+        for target, source in zip(lhs.targets, lhs.sources)
+    ]
+
+
+class CompositeRelatedExact(RelatedExact):
+    """
+    'exact' lookup for CPkForeignKey.
+      The rhs is a model instance, a tuple of values, or the values joined by CPK_SEP.
+    """
+    def get_prep_lookup(self):
+        if isinstance(self.lhs, MultiColSource) and self.rhs_is_direct_value():
+            return related_key_row(self.lhs, self.rhs)
+        return super().get_prep_lookup()
+
+    def as_sql(self, compiler, connection):
+        if isinstance(self.lhs, MultiColSource) and self.rhs_is_direct_value():
+            cols = compile_related_cols(self.lhs, compiler)
+            sql = "(%s)" % " AND ".join("%s = %%s" % col for col in cols)
+            params = [
+                target.get_db_prep_value(val, connection, prepared=True)
+                for target, val in zip(self.lhs.targets, self.rhs)
+            ]
+            return sql, params
+        return super().as_sql(compiler, connection)
+
+
+class CompositeRelatedIn(RelatedIn):
+    """
+    'in' lookup for CPkForeignKey.
+      It's compiled with the same strategy as CompositeIn.
+    """
+    def get_prep_lookup(self):
+        if isinstance(self.lhs, MultiColSource) and self.rhs_is_direct_value():
+            rows = (related_key_row(self.lhs, value) for value in self.rhs)
+            return [row for row in dict.fromkeys(rows) if None not in row]
+        return super().get_prep_lookup()
+
+    def as_sql(self, compiler, connection):
+        if isinstance(self.lhs, MultiColSource) and self.rhs_is_direct_value():
+            cols = compile_related_cols(self.lhs, compiler)
+            sql, params, _ = compile_in(cols, self.lhs.targets, self.rhs, connection)
+            return sql, params
+        return super().as_sql(compiler, connection)
+
+
+class CompositeRelatedCompareMixin:
+    """
+    Comparison lookups for CPkForeignKey in the lexicographic order of the keys.
+    """
+    def get_prep_lookup(self):
+        if isinstance(self.lhs, MultiColSource) and self.rhs_is_direct_value():
+            return related_key_row(self.lhs, self.rhs)
+        return super().get_prep_lookup()
+
+    def as_sql(self, compiler, connection):
+        if isinstance(self.lhs, MultiColSource) and self.rhs_is_direct_value():
+            cols = compile_related_cols(self.lhs, compiler)
+            return compile_compare(cols, self.lhs.targets, self.rhs, self.lookup_name, connection)
+        return super().as_sql(compiler, connection)
+
+
+class CompositeRelatedGreaterThan(CompositeRelatedCompareMixin, RelatedGreaterThan):
+    pass
+
+
+class CompositeRelatedGreaterThanOrEqual(CompositeRelatedCompareMixin, RelatedGreaterThanOrEqual):
+    pass
+
+
+class CompositeRelatedLessThan(CompositeRelatedCompareMixin, RelatedLessThan):
+    pass
+
+
+class CompositeRelatedLessThanOrEqual(CompositeRelatedCompareMixin, RelatedLessThanOrEqual):
+    pass
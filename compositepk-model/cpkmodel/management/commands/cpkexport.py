@@ -0,0 +1,89 @@
+"""
+Export the rows of a CPkModel in the order of the primary keys.
+  python manage.py cpkexport test.Album --output album.csv --checkpoint album.json
+  python manage.py cpkexport test.Album --format ndjson --fields name num_stars
+The export interrupted is resumed from the checkpoint by the same command,
+after the output is truncated to the size at the checkpoint.
+"""
+
+import json
+import os
+
+from django.apps import apps
+from django.core.exceptions import FieldError
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+
+from cpkmodel.constants import EXPORT_CHUNK_SIZE
+from cpkmodel.cpkquery import CPkQuerySet
+from cpkmodel.export import WRITERS, dump_checkpoint, load_checkpoint
+
+
+class Command(BaseCommand):
+    help = 'Export the rows of a CPkModel to CSV or NDJSON in the order of the primary keys.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('model', help='Model to export, as app_label.ModelName.')
+        parser.add_argument('--format', default='csv', choices=sorted(WRITERS), help='Format of the output.')
+        parser.add_argument('--fields', nargs='+', help='Names of the fields(all the concrete fields by default).')
+        parser.add_argument('--output', help='File to write the rows(stdout by default).')
+        parser.add_argument('--checkpoint',
+                            help='File of the last key exported and the size of the output. '
+                                 'If it exists, the export resumes after the key.')
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help='Rows read by each query.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS, help='Database to export from.')
+
+    def handle(self, *args, **options):
+        try:
+            model = apps.get_model(options['model'])
+        except (LookupError, ValueError) as e:
+            raise CommandError(str(e))
+        queryset = model._default_manager.using(options['database'])
+        if not isinstance(queryset, CPkQuerySet):
+            raise CommandError('%s is not managed by CPkManager.' % model._meta.label)
+        if options['chunk_size'] <= 0:
+            raise CommandError('--chunk-size must be positive.')
+
+        start = None
+        done = 0
+        offset = None
+        checkpoint_path = options['checkpoint']
+        if checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, encoding='utf-8') as f:
+                data = json.load(f)
+            start = load_checkpoint(model, data)
+            done = data['rows']
+            offset = data.get('offset')
+
+        output = options['output']
+        if not output:
+            fp = self.stdout
+        elif start is None:
+            fp = open(output, 'w', encoding='utf-8', newline='')
+        else:
+            if offset is None or not os.path.exists(output):
+                raise CommandError("Can't resume the export to %s from the checkpoint." % output)
+            fp = open(output, 'r+', encoding='utf-8', newline='')
+            # Drop the rows written after the checkpoint(the chunk, or the line torn by the interruption).
+            fp.seek(offset)
+            fp.truncate()
+
+        def save_checkpoint(key, count):
+            # Replaced at once, so the checkpoint is never broken by the interruption.
+            tmp_path = checkpoint_path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(dump_checkpoint(key, done + count, fp.tell() if output else None))
+            os.replace(tmp_path, checkpoint_path)
+
+        try:
+            count, _ = queryset.export(
+                fp, format=options['format'], fields=options['fields'],
+                chunk_size=options['chunk_size'], start=start,
+                checkpoint=save_checkpoint if checkpoint_path else None,
+            )
+        except FieldError as e:
+            raise CommandError(str(e))
+        finally:
+            if fp is not self.stdout:
+                fp.close()
+        self.stderr.write('%d rows exported(%d in total).' % (count, done + count))
@@ -0,0 +1,200 @@
+"""
+Paginator by the primary keys(keyset pagination) for CPkQuerySet.
+"""
+
+from django.core.paginator import Page, Paginator
+from django.http import Http404
+from django.utils.functional import cached_property
+
+from .identitymap import make_key
+from .lookups import CPkStr
+
+
+class KeysetPage(Page):
+    """
+    Page of KeysetPaginator.
+      next_key     : key to get the next page by KeysetPaginator.page_after().
+      previous_key : key to get the previous page by KeysetPaginator.page_before().
+    The pages of page_after()/page_before() have no number.
+    """
+    def __init__(self, object_list, number, paginator, has_next=None, has_previous=None):
+        super().__init__(object_list, number, paginator)
+        self._has_next = has_next
+        self._has_previous = has_previous
+
+    def __repr__(self):
+        if self.number is None:
+            return '<Page by key>'
+        return super().__repr__()
+
+    def has_next(self):
+        if self._has_next is None:
+            return super().has_next()
+        return self._has_next
+
+    def has_previous(self):
+        if self._has_previous is None:
+            return super().has_previous()
+        return self._has_previous
+
+    @property
+    def next_key(self):
+        if self.has_next() and self.object_list:
+            return self.object_list[-1].pkvals
+        return None
+
+    @property
+    def previous_key(self):
+        if self.has_previous() and self.object_list:
+            return self.object_list[0].pkvals
+        return None
+
+    @property
+    def next_cursor(self):
+        """ next_key joined by CPK_SEP, for '?after=' of KeysetPaginationMixin. """
+        key = self.next_key
+        return None if key is None else CPkStr(key)
+
+    @property
+    def previous_cursor(self):
+        """ previous_key joined by CPK_SEP, for '?before=' of KeysetPaginationMixin. """
+        key = self.previous_key
+        return None if key is None else CPkStr(key)
+
+
+class KeysetPaginator(Paginator):
+    """
+    Paginator which seeks the pages by the primary keys instead of OFFSET.
+      The object_list must be CPkQuerySet ordered by the primary keys
+      (ascending or descending) or not ordered, otherwise it's paginated by OFFSET.
+    page(number)
+      For ListView and the admin changelist.
+      The first key of the page is found by the keys only(OFFSET on the index
+      of the primary keys), then the objects are fetched from the key. So the
+      other columns of the rows before the page are not read, but the cost
+      still grows with the number, and COUNT is run(twice in the admin
+      changelist unless ModelAdmin.show_full_result_count is False).
+    page_after(key) / page_before(key)
+      The next / previous page of the key, without COUNT and OFFSET.
+      The cost of deep pages is the same as the first page.
+      ListView serves them by KeysetPaginationMixin.
+    Ex.
+        class AlbumListView(KeysetPaginationMixin, ListView):
+            paginate_by = 100
+
+        class AlbumAdmin(admin.ModelAdmin):
+            paginator = KeysetPaginator
+    """
+    @cached_property
+    def key_order(self):
+        """ 'pk' or '-pk' if the pages can be sought by the keys, otherwise None. """
+        queryset = self.object_list
+        if not hasattr(queryset, 'after'):
+            return None
+        query = queryset.query
+        plan = queryset.model.pkplan
+        ordering = tuple(query.order_by)
+        if not ordering and query.default_ordering:
+            ordering = tuple(query.get_meta().ordering)
+        if ordering in ((), ('pk',), plan.names):
+            return 'pk'
+        elif ordering in (('-pk',), plan.desc_names):
+            return '-pk'
+        return None
+
+    def _check_object_list_is_ordered(self):
+        # Ordered by the primary keys in seeking.
+        if self.key_order is None:
+            super()._check_object_list_is_ordered()
+
+    def _get_page(self, *args, **kwargs):
+        return KeysetPage(*args, **kwargs)
+
+    def _seek(self, key, forward, inclusive=False):
+        queryset = self.object_list
+        if forward == (self.key_order == 'pk'):
+            return queryset.after(key, inclusive=inclusive)
+        else:
+            return queryset.before(key, inclusive=inclusive)
+
+    def page(self, number):
+        """ Return a Page object for the given 1-based page number. """
+        number = self.validate_number(number)
+        if self.key_order is None:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        top = bottom + self.per_page
+        if top + self.orphans >= self.count:
+            top = self.count
+        if bottom:
+            # The keys are read from the index of the primary key.
+            names = self.object_list.model.pkplan.names
+            first_key = self.object_list.order_by(self.key_order).values_list(*names)[bottom]
+            queryset = self._seek(first_key, forward=True, inclusive=True)
+        else:
+            queryset = self.object_list.order_by(self.key_order)
+        return self._get_page(list(queryset[:top - bottom]), number, self)
+
+    def page_after(self, key=None):
+        """ Return the page following 'key'. If key is None, return the first page. """
+        if self.key_order is None:
+            raise ValueError('page_after() requires the queryset ordered by the primary keys.')
+        if key is None:
+            queryset = self.object_list.order_by(self.key_order)
+        else:
+            queryset = self._seek(key, forward=True)
+        objs = list(queryset[:self.per_page + 1])
+        return self._get_page(
+            objs[:self.per_page], None, self,
+            has_next=len(objs) > self.per_page,
+            has_previous=key is not None,
+        )
+
+    def page_before(self, key):
+        """ Return the page preceding 'key'. """
+        if self.key_order is None:
+            raise ValueError('page_before() requires the queryset ordered by the primary keys.')
+        objs = list(self._seek(key, forward=False)[:self.per_page + 1])
+        return self._get_page(
+            objs[:self.per_page][::-1], None, self,
+            has_next=True,
+            has_previous=len(objs) > self.per_page,
+        )
+
+
+class KeysetPaginationMixin:
+    """
+    Mixin of ListView paginated by the keys in the query string.
+      '?after=<key>' / '?before=<key>'(the key values joined by CPK_SEP, e.g.
+      page_obj.next_cursor) are served by page_after() / page_before(),
+      so the cost of deep pages is the same as the first page.
+      Without them, the page is page(number) of KeysetPaginator.
+    Ex.
+        {% if page_obj.has_next %}<a href="?after={{ page_obj.next_cursor|urlencode }}">next</a>{% endif %}
+    """
+    paginator_class = KeysetPaginator
+    after_kwarg = 'after'
+    before_kwarg = 'before'
+
+    def paginate_queryset(self, queryset, page_size):
+        after = self.request.GET.get(self.after_kwarg)
+        before = self.request.GET.get(self.before_kwarg)
+        if after is None and before is None:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = self.get_paginator(
+            queryset, page_size, orphans=self.get_paginate_orphans(),
+            allow_empty_first_page=self.get_allow_empty(),
+        )
+        cursor = after if after is not None else before
+        key = make_key(queryset.model, cursor)
+        if key is None:
+            raise Http404('Invalid page (%s): not a key of %s.' % (cursor, queryset.model._meta.object_name))
+        try:
+            if after is not None:
+                page = paginator.page_after(key)
+            else:
+                page = paginator.page_before(key)
+        except ValueError as e:
+            # Not ordered by the primary keys.
+            raise Http404('Invalid page (%s): %s' % (cursor, e))
+        return (paginator, page, page.object_list, page.has_other_pages())
@@ -0,0 +1,165 @@
+"""
+ForeignKey to the model with composite primary key.
+"""
+
+from django.db import connections
+from django.db.models import ForeignObject
+from django.db.models.constants import LOOKUP_SEP
+from django.db.models.fields.related_descriptors import (
+    ForwardManyToOneDescriptor,
+    ReverseManyToOneDescriptor,
+)
+from django.utils.functional import cached_property
+
+from .constants import CPK_SEP
+from .lookups import (
+    CompositeRelatedExact,
+    CompositeRelatedIn,
+    CompositeRelatedGreaterThan,
+    CompositeRelatedGreaterThanOrEqual,
+    CompositeRelatedLessThan,
+    CompositeRelatedLessThanOrEqual,
+)
+
+
+def get_instance_value_for_fields(instance, fields):
+    """
+    Return the tuple of the values of 'fields' in 'instance'.
+      instance.pk of CPkModel is the joined value of all the keys,
+      so Django's ForeignObject.get_instance_value_for_fields() can't be used
+      for the key fields.
+    """
+    if getattr(instance, 'has_compositepk', False):
+        return tuple(getattr(instance, field.attname) for field in fields)
+    return ForeignObject.get_instance_value_for_fields(instance, fields)
+
+
+def get_cache_name(field):
+    # Django(>=5.1) has cache_name instead of get_cache_name().
+    try:
+        return field.cache_name
+    except AttributeError:
+        return field.get_cache_name()
+
+
+def prefetch_by_keys(queryset, name, fields, keys):
+    """
+    Evaluate 'queryset' filtered by '<name>__in' with the key tuples.
+      The keys are queried by chunks of the batch size of the backend, and
+      each chunk is compiled by CompositeIn or CompositeRelatedIn.
+    Return the queryset with the result cache.
+    """
+    keys = list(keys)
+    batch_size = max(connections[queryset.db].ops.bulk_batch_size(fields, keys), 1)
+    lookup = name + LOOKUP_SEP + 'in'
+    # MEMO: prefetch_related_objects() prefetches the lookups of queryset
+    #         for all the results, not for each chunk.
+    chunk_qs = queryset._chain()
+    chunk_qs._prefetch_related_lookups = ()
+    objs = []
+    for offset in range(0, len(keys), batch_size):
+        objs.extend(chunk_qs.filter(**{lookup: keys[offset:offset + batch_size]}))
+    queryset._result_cache = objs
+    return queryset
+
+
+class CPkForwardDescriptor(ForwardManyToOneDescriptor):
+    """ Accessor to the related object of CPkForeignKey. """
+
+    def get_prefetch_querysets(self, instances, querysets=None):
+        queryset = querysets[0] if querysets else self.get_queryset()
+        queryset._add_hints(instance=instances[0])
+
+        rel_obj_attr = self.field.get_foreign_related_value
+        instance_attr = self.field.get_local_related_value
+        instances_dict = {instance_attr(inst): inst for inst in instances}
+        keys = [key for key in instances_dict if None not in key]
+        fields = self.field.foreign_related_fields
+        name = CPK_SEP.join(f.name for f in fields)
+        # There can be only one object prefetched for each instance.
+        queryset = prefetch_by_keys(queryset.order_by(), name, fields, keys)
+        return queryset, rel_obj_attr, instance_attr, True, get_cache_name(self.field), False
+
+    def get_prefetch_queryset(self, instances, queryset=None):
+        # Django < 5.0
+        return self.get_prefetch_querysets(instances, [queryset] if queryset is not None else None)
+
+
+class CPkReverseDescriptor(ReverseManyToOneDescriptor):
+    """ Accessor to the objects related by CPkForeignKey. """
+
+    @cached_property
+    def related_manager_cls(self):
+        manager_cls = super().related_manager_cls
+        field = self.field
+
+        class CPkRelatedManager(manager_cls):
+            def get_prefetch_querysets(self, instances, querysets=None):
+                queryset = querysets[0] if querysets else super(manager_cls, self).get_queryset()
+                queryset._add_hints(instance=instances[0])
+                queryset = queryset.using(queryset._db or self._db)
+
+                rel_obj_attr = field.get_local_related_value
+                instance_attr = field.get_foreign_related_value
+                instances_dict = {instance_attr(inst): inst for inst in instances}
+                keys = [key for key in instances_dict if None not in key]
+                queryset = prefetch_by_keys(queryset, field.name, field.local_related_fields, keys)
+
+                # Since we just bypassed this class' get_queryset(), we must manage
+                # the reverse relation manually.
+                for rel_obj in queryset:
+                    if not field.is_cached(rel_obj):
+                        instance = instances_dict[rel_obj_attr(rel_obj)]
+                        field.set_cached_value(rel_obj, instance)
+                cache_name = get_cache_name(field.remote_field)
+                return queryset, rel_obj_attr, instance_attr, False, cache_name, False
+
+            def get_prefetch_queryset(self, instances, queryset=None):
+                # Django < 5.0
+                return self.get_prefetch_querysets(instances, [queryset] if queryset is not None else None)
+
+        return CPkRelatedManager
+
+
+class CPkForeignKey(ForeignObject):
+    """
+    ForeignKey whose join condition covers all the key columns.
+      to_fields   : fields of the related model.
+                    The default is the primary keys of the related model.
+      from_fields : local fields for each of to_fields.
+                    The default is the fields with the same names as to_fields.
+    Ex.
+        album = CPkForeignKey(Album, on_delete=models.CASCADE,
+                              from_fields=('artist', 'album_no'))
+    """
+    forward_related_accessor_class = CPkForwardDescriptor
+    related_accessor_class = CPkReverseDescriptor
+
+    def __init__(self, to, on_delete, from_fields=None, to_fields=None, **kwargs):
+        super().__init__(
+            to, on_delete,
+            from_fields=tuple(from_fields or ()),
+            to_fields=tuple(to_fields or ()),
+            **kwargs
+        )
+
+    def resolve_related_fields(self):
+        # MEMO: The related model may be declared later,
+        #         so the default fields are resolved at the first access.
+        model = self.remote_field.model
+        if not self.to_fields and not isinstance(model, str):
+            pkplan = getattr(model, 'pkplan', None)
+            self.to_fields = pkplan.names if pkplan else (model._meta.pk.name,)
+        if not self.from_fields:
+            self.from_fields = self.to_fields
+        return super().resolve_related_fields()
+
+    get_instance_value_for_fields = staticmethod(get_instance_value_for_fields)
+
+
+CPkForeignKey.register_lookup(CompositeRelatedExact)
+CPkForeignKey.register_lookup(CompositeRelatedIn)
+CPkForeignKey.register_lookup(CompositeRelatedGreaterThan)
+CPkForeignKey.register_lookup(CompositeRelatedGreaterThanOrEqual)
+CPkForeignKey.register_lookup(CompositeRelatedLessThan)
+CPkForeignKey.register_lookup(CompositeRelatedLessThanOrEqual)
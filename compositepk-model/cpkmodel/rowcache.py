@@ -0,0 +1,206 @@
+"""
+Cache of CPkModel rows on Django's cache framework.
+"""
+
+import hashlib
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import DEFAULT_CACHE_ALIAS, caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import DEFAULT_DB_ALIAS, connections, router, transaction
+from django.db.models.signals import post_delete, post_save
+
+from .identitymap import make_key
+
+# Caches of the models: {model: CPkCache}
+_caches = {}
+
+
+def encode_key(values):
+    """
+    Encode the key values to a string without collisions.
+      Each value is prefixed by the length of its string,
+      so the values containing CPK_SEP(or ':') are not confused.
+      Ex. (1,'A,B') -> '1:1|3:A,B' and (1,'A','B') -> '1:1|1:A|1:B'
+    """
+    strs = [str(val) for val in values]
+    return '|'.join('%d:%s' % (len(s), s) for s in strs)
+
+
+class CPkCache:
+    """
+    Read-through cache of the rows of a model.
+      alias   : alias of CACHES.
+      timeout : timeout of the rows(DEFAULT_TIMEOUT of the cache by default).
+    The rows of the model are invalidated by save(), delete(), update(),
+    bulk_update() and bulk_upsert() of the model(and the cascades of delete()).
+    The objects of the model are not fast-deleted, because they are
+    listened by post_delete for the cascades from the other models.
+    Ex.
+        class CompanyBranch(CPkModel):
+            ...
+            cache = CPkCache(timeout=3600)
+
+        branch = CompanyBranch.cache.get((1,'JP'))
+        branches = CompanyBranch.cache.get_many([(1,'JP'),(1,'US')])
+    """
+    def __init__(self, alias=DEFAULT_CACHE_ALIAS, timeout=DEFAULT_TIMEOUT, key_prefix='cpkmodel'):
+        self.alias = alias
+        self.timeout = timeout
+        self.key_prefix = key_prefix
+        self.model = None
+
+    def contribute_to_class(self, cls, name):
+        self.model = cls
+        setattr(cls, name, self)
+        if not cls._meta.abstract:
+            _caches[cls] = self
+            # For the cascades from the models other than CPkModel.
+            post_delete.connect(_invalidate_changed, sender=cls, dispatch_uid='cpkmodel_row_cache')
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def _version_key(self):
+        return '%s:%s:version' % (self.key_prefix, self.model._meta.label)
+
+    def _row_key(self, using, key):
+        # The key is hashed to be available on any cache backend(e.g. memcached).
+        digest = hashlib.sha256(encode_key(key).encode()).hexdigest()
+        return '%s:%s:%s:%s' % (self.key_prefix, self.model._meta.label, using, digest)
+
+    def _get_version(self, version):
+        # The version is lost if it's evicted, then all the rows are stale.
+        if version is None:
+            self.cache.add(self._version_key(), uuid.uuid4().hex, None)
+            version = self.cache.get(self._version_key())
+        return version
+
+    def invalidate(self):
+        """ Invalidate all the rows of the model. """
+        self.cache.set(self._version_key(), uuid.uuid4().hex, None)
+
+    def _db_for_read(self, using):
+        return using or router.db_for_read(self.model)
+
+    def _dump(self, obj):
+        return tuple(getattr(obj, field.attname) for field in self.model._meta.concrete_fields)
+
+    def _load(self, using, values):
+        attnames = [field.attname for field in self.model._meta.concrete_fields]
+        return self.model.from_db(using, attnames, values)
+
+    def _result_key(self, key):
+        # Keys of the result are the same as in_bulk().
+        return key if self.model.has_compositepk else key[0]
+
+    def get(self, pk, using=None):
+        """
+        Return the object of 'pk'(tuple, or the values joined by CPK_SEP).
+        The row is read from the database if it isn't cached.
+        """
+        objs = self.get_many([pk], using)
+        if not objs:
+            raise self.model.DoesNotExist(
+                '%s matching query does not exist.' % self.model._meta.object_name
+            )
+        obj, = objs.values()
+        return obj
+
+    def get_many(self, pks, using=None):
+        """
+        Return a dictionary mapping each of the given pks to the object like in_bulk().
+        The rows not cached are read by one query(multi-column 'in' lookup).
+        """
+        using = self._db_for_read(using)
+        keys = {}
+        for pk in pks:
+            key = make_key(self.model, pk)
+            if key is not None:
+                keys.setdefault(self._row_key(using, key), key)
+        if not keys:
+            return {}
+        version_key = self._version_key()
+        cached = self.cache.get_many([version_key, *keys])
+        version = self._get_version(cached.pop(version_key, None))
+        found = {}
+        misses = []
+        for row_key, key in keys.items():
+            entry = cached.get(row_key)
+            if entry is not None and entry[0] == version:
+                found[self._result_key(key)] = self._load(using, entry[1])
+            else:
+                misses.append(key)
+        if misses:
+            manager = self.model._base_manager.using(using)
+            if self.model.has_compositepk:
+                objs = manager.in_bulk(misses).values()
+            else:
+                objs = manager.in_bulk([key[0] for key in misses]).values()
+            entries = {}
+            for obj in objs:
+                found[self._result_key(obj.pkvals)] = obj
+                entries[self._row_key(using, obj.pkvals)] = (version, self._dump(obj))
+            # MEMO: The rows read before an update are stored with the old version,
+            #         so they are not read after the update.
+            self.cache.set_many(entries, self.timeout)
+        return found
+
+
+def _invalidate_on_commit(model_cache, using):
+    model_cache.invalidate()
+    # The rows may be read before the commit by the other connections.
+    if connections[using].in_atomic_block:
+        transaction.on_commit(model_cache.invalidate, using=using)
+
+
+def invalidate(model, using=DEFAULT_DB_ALIAS):
+    """ Invalidate the cached rows of 'model'. """
+    model_cache = _caches.get(model)
+    if model_cache is not None:
+        _invalidate_on_commit(model_cache, using)
+
+
+def invalidate_deleted(model, using=DEFAULT_DB_ALIAS):
+    """
+    Invalidate the cached rows of 'model' and the related models,
+    which may be deleted or updated by the cascades.
+    """
+    if not _caches:
+        return
+    models = set()
+    stack = [model]
+    while stack:
+        related = stack.pop()
+        if related not in models:
+            models.add(related)
+            stack.extend(rel.related_model for rel in related._meta.related_objects)
+    for related in models:
+        invalidate(related, using)
+
+
+@contextmanager
+def invalidating(model, using=DEFAULT_DB_ALIAS, deleted=False):
+    """
+    Invalidate the cached rows of 'model'(and the related models if 'deleted')
+    after the write in the block.
+      MEMO: Not before the write. A row read between the invalidation and
+              the write would be cached with the new version, and served
+              until the timeout.
+    """
+    try:
+        yield
+    finally:
+        if deleted:
+            invalidate_deleted(model, using)
+        else:
+            invalidate(model, using)
+
+
+def _invalidate_changed(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    invalidate(sender, using)
+
+
+post_save.connect(_invalidate_changed, dispatch_uid='cpkmodel_row_cache')
@@ -1,5 +1,7 @@
 from django.contrib import admin
 
+from cpkmodel import KeysetPaginator
+
 from .models import Musician,Album,Company,CompanyBranch
 
 admin.site.register(Musician)
@@ -8,5 +10,6 @@ admin.site.register(Company)
 
 class CompanyBranchAdmin(admin.ModelAdmin):
     list_display = ('company', 'country_code', 'name', 'established_date')
+    paginator = KeysetPaginator
 
 admin.site.register(CompanyBranch, CompanyBranchAdmin)
@@ -0,0 +1,289 @@
+"""
+Benchmarks of the composite-key ORM operations on the test models.
+  Run by 'python manage.py benchmark'.
+"""
+
+import csv
+import datetime
+import io
+import platform
+import statistics
+import sqlite3
+import time
+
+import django
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.test import Client
+
+from test.models import Album, Company, CompanyBranch, Musician
+
+TODAY = datetime.date(2021, 6, 6)
+COUNTRY_CODES = ['C%02d' % no for no in range(20)]
+
+
+class Benchmark:
+    """
+    Benchmark case.
+      func   : function to measure. setup() is called before each repeat,
+               and its return value is passed to func.
+      number : calls of func in each repeat. The timings are per call.
+      atomic : each repeat is rolled back(for the cases changing the rows).
+    """
+    def __init__(self, name, func, setup=None, number=1, atomic=False, **params):
+        self.name = name
+        self.func = func
+        self.setup = setup or (lambda: None)
+        self.number = number
+        self.atomic = atomic
+        self.params = params
+        self.queries = 0
+
+    def _count_query(self, execute, sql, params, many, context):
+        self.queries += 1
+        return execute(sql, params, many, context)
+
+    def _run_once(self):
+        arg = self.setup()
+        with connection.execute_wrapper(self._count_query):
+            start = time.perf_counter()
+            for _ in range(self.number):
+                self.func(arg)
+            elapsed = time.perf_counter() - start
+        return elapsed / self.number
+
+    def _measure(self):
+        if not self.atomic:
+            return self._run_once()
+        with transaction.atomic():
+            elapsed = self._run_once()
+            transaction.set_rollback(True)
+        return elapsed
+
+    def run(self, repeat):
+        # The first run warms up the caches(e.g. the features of the backend).
+        self._measure()
+        self.queries = 0
+        timings = [self._measure() * 1000 for _ in range(repeat)]
+        return {
+            'name': self.name,
+            'params': self.params,
+            'number': self.number,
+            'repeat': repeat,
+            'queries': self.queries // (self.number * repeat),
+            'min_ms': min(timings),
+            'median_ms': statistics.median(timings),
+            'mean_ms': statistics.mean(timings),
+        }
+
+
+def populate(rows):
+    """ Insert 'rows' Albums(20 for each Musician) and the CompanyBranches as many. """
+    companies = Company.objects.bulk_create([
+        Company(name='Company %d' % no, established_date=TODAY, company_code='CODE%d' % no)
+        for no in range(max(rows // len(COUNTRY_CODES), 1))
+    ])
+    if not companies[0].pk:
+        companies = list(Company.objects.order_by('pk'))
+    CompanyBranch.objects.bulk_create([
+        CompanyBranch(company=company, country_code=code, name='Branch %s' % code, established_date=TODAY)
+        for company in companies for code in COUNTRY_CODES
+    ])
+    musicians = Musician.objects.bulk_create([
+        Musician(first_name='First %d' % no, last_name='Last %d' % no, profile='')
+        for no in range(len(companies))
+    ])
+    if not musicians[0].pk:
+        musicians = list(Musician.objects.order_by('pk'))
+    Album.objects.bulk_create([
+        Album(
+            artist=musician, album_no=no, name='Album %d' % no, release_date=TODAY,
+            num_stars=3, item_code='ITEM%d' % no, company=companies[0],
+        )
+        for musician in musicians for no in range(1, 21)
+    ])
+
+
+def export_by_cursor(model, fp):
+    """ Write the rows of 'model' as CSV by the raw cursor, the baseline of export(). """
+    meta = model._meta
+    columns = [field.column for field in meta.concrete_fields]
+    writer = csv.writer(fp)
+    writer.writerow([field.attname for field in meta.concrete_fields])
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT %s FROM %s ORDER BY %s' % (
+            ', '.join(map(connection.ops.quote_name, columns)),
+            connection.ops.quote_name(meta.db_table),
+            ', '.join(map(connection.ops.quote_name, model.pkplan.columns)),
+        ))
+        writer.writerows(cursor)
+
+
+def admin_client():
+    user_model = get_user_model()
+    user = user_model.objects.filter(username='benchmark').first()
+    if user is None:
+        user = user_model.objects.create_superuser('benchmark', 'benchmark@example.com', 'benchmark')
+    client = Client()
+    client.force_login(user)
+    return client
+
+
+def get_benchmarks(rows):
+    albums = list(Album.objects.order_by('pk')[:rows])
+    keys = [album.pkvals for album in albums]
+    artist_id = keys[0][0]
+    benchmarks = [
+        Benchmark(
+            'filter_pk_compile',
+            lambda _: str(Album.objects.filter(pk=(artist_id, 1)).query),
+            number=200,
+        ),
+        Benchmark(
+            'filter_pk_compile',
+            lambda _: str(Album.objects.filter(pk='%d,1' % artist_id).query),
+            number=200, value='joined',
+        ),
+        Benchmark(
+            'get_pk',
+            lambda _: Album.objects.get(pk=(artist_id, 1)),
+            number=100,
+        ),
+        Benchmark(
+            'fetch_pk',
+            lambda _: Album.objects.fetch((artist_id, 1)),
+            number=100,
+        ),
+    ]
+    for size in (10, 1000, 100000):
+        # The keys not in the table are also queried.
+        in_keys = keys[:size]
+        in_keys += [(0, no) for no in range(size - len(in_keys))]
+        benchmarks.append(Benchmark(
+            'filter_pk_in',
+            lambda _, in_keys=in_keys: list(Album.objects.filter(pk__in=in_keys)),
+            keys=size,
+        ))
+
+    def setup_update():
+        for album in albums:
+            album.num_stars += 1
+        return albums
+
+    for batch_size in (None, 100, 1000):
+        for use_join in (True, False):
+            benchmarks.append(Benchmark(
+                'bulk_update',
+                lambda objs, batch_size=batch_size, use_join=use_join: Album.objects.bulk_update(
+                    objs, ['num_stars'], batch_size=batch_size, use_join=use_join,
+                ),
+                setup=setup_update, atomic=True,
+                rows=len(albums), batch_size=batch_size, use_join=use_join,
+            ))
+
+    delete_rows = min(rows, 200)
+    branches = list(CompanyBranch.objects.order_by('pk')[:delete_rows])
+    benchmarks += [
+        Benchmark(
+            'delete',
+            lambda objs: [obj.delete() for obj in objs],
+            setup=lambda: branches, atomic=True,
+            rows=len(branches), method='instance',
+        ),
+        Benchmark(
+            'delete',
+            lambda objs: CompanyBranch.objects.bulk_delete(objs),
+            setup=lambda: branches, atomic=True,
+            rows=len(branches), method='bulk_delete',
+        ),
+        Benchmark(
+            'delete',
+            lambda objs: CompanyBranch.objects.filter(pk__in=[obj.pkvals for obj in objs]).delete(),
+            setup=lambda: branches, atomic=True,
+            rows=len(branches), method='queryset',
+        ),
+        Benchmark(
+            'pk_access',
+            lambda objs: [obj.pk for obj in objs],
+            setup=lambda: albums, number=10,
+            rows=len(albums),
+        ),
+        Benchmark(
+            'pkvals_access',
+            lambda objs: [obj.pkvals for obj in objs],
+            setup=lambda: albums, number=10,
+            rows=len(albums),
+        ),
+        Benchmark(
+            'iter_by_pk',
+            lambda _: list(Album.objects.iter_by_pk()),
+            rows=len(albums), method='objects',
+        ),
+        Benchmark(
+            'iter_by_pk',
+            lambda _: list(Album.objects.rows().iter_by_pk()),
+            rows=len(albums), method='rows',
+        ),
+        Benchmark(
+            'export',
+            lambda _: Album.objects.export(io.StringIO()),
+            rows=len(albums), method='export',
+        ),
+        Benchmark(
+            'export',
+            lambda _: export_by_cursor(Album, io.StringIO()),
+            rows=len(albums), method='cursor',
+        ),
+    ]
+
+    client = admin_client()
+    for model in (Album, CompanyBranch):
+        url = '/admin/%s/%s/' % (model._meta.app_label, model._meta.model_name)
+        benchmarks.append(Benchmark(
+            'admin_changelist',
+            lambda _, url=url: client.get(url),
+            model=model._meta.label,
+        ))
+        benchmarks.append(Benchmark(
+            'admin_changelist',
+            lambda _, url=url: client.get(url, {'p': 5}),
+            model=model._meta.label, page=5,
+        ))
+    return benchmarks
+
+
+def run_benchmarks(rows=2000, repeat=5, names=None):
+    """ Run the benchmarks and return the results(dict for JSON). """
+    results = []
+    for benchmark in get_benchmarks(rows):
+        if names and benchmark.name not in names:
+            continue
+        results.append(benchmark.run(repeat))
+    return {
+        'environment': {
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'vendor': connection.vendor,
+        },
+        'rows': rows,
+        'results': results,
+    }
+
+
+def result_key(result):
+    return (result['name'], tuple(sorted((k, str(v)) for k, v in result['params'].items())))
+
+
+def compare_results(results, baseline, tolerance):
+    """
+    Return the results slower than the baseline by more than 'tolerance'(ratio),
+    as the list of (result, baseline result).
+    """
+    base_results = {result_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in results['results']:
+        base = base_results.get(result_key(result))
+        if base and result['median_ms'] > base['median_ms'] * (1 + tolerance):
+            regressions.append((result, base))
+    return regressions
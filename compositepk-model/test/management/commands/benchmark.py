@@ -0,0 +1,63 @@
+"""
+Run the benchmarks of the composite-key ORM operations on a test database.
+  python manage.py benchmark --output result.json
+  python manage.py benchmark --baseline result.json --tolerance 0.2
+"""
+
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+class Command(BaseCommand):
+    help = 'Run the benchmarks of CPkModel on a test database and print the results as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('names', nargs='*', help='Names of the benchmarks to run(all by default).')
+        parser.add_argument('--rows', type=int, default=2000, help='Number of Albums and CompanyBranches.')
+        parser.add_argument('--repeat', type=int, default=5, help='Repeats of each benchmark.')
+        parser.add_argument('--output', help='File to write the results(stdout by default).')
+        parser.add_argument('--baseline', help='Results of the previous run to compare with.')
+        parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Ratio of the slowdown from the baseline regarded as a regression.')
+
+    def handle(self, *args, **options):
+        # Imported after the settings are configured.
+        from test.benchmarks import compare_results, populate, run_benchmarks
+        from test.tests import create_tables
+
+        if options['rows'] < 20 or options['repeat'] < 1:
+            raise CommandError('--rows must be at least 20 and --repeat must be positive.')
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline'], encoding='utf-8') as f:
+                baseline = json.load(f)
+
+        setup_test_environment()
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            create_tables()
+            populate(options['rows'])
+            results = run_benchmarks(options['rows'], options['repeat'], options['names'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        output = json.dumps(results, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as f:
+                f.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+        if baseline is not None:
+            regressions = compare_results(results, baseline, options['tolerance'])
+            for result, base in regressions:
+                self.stderr.write('%s %s: %.3fms (baseline %.3fms)' % (
+                    result['name'], result['params'], result['median_ms'], base['median_ms'],
+                ))
+            if regressions:
+                raise CommandError('%d benchmark(s) regressed.' % len(regressions))
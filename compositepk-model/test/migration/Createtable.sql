@@ -16,6 +16,10 @@ CREATE INDEX "Album_artist_id" ON "Album" ("artist_id");
 CREATE INDEX "Album_company_id" ON "Album" ("company_id");
 
 
+CREATE TABLE "Track" ("artist_id" integer NOT NULL REFERENCES "Musician" ("id") DEFERRABLE INITIALLY DEFERRED, "album_no" integer NOT NULL, "track_no" integer NOT NULL, "name" varchar(100) NOT NULL);
+CREATE UNIQUE INDEX "Track_artist_id_album_no_track_no_uniq" ON "Track" ("artist_id", "album_no", "track_no");
+
+
 #################################
 # For PsotgreSQL
 
@@ -31,3 +35,6 @@ CREATE TABLE "Album" ("artist_id" integer NOT NULL REFERENCES "Musician" ("id")
 CREATE UNIQUE INDEX "Album_artist_id_album_no_uniq" ON "Album" ("artist_id", "album_no");
 CREATE INDEX "Album_artist_id" ON "Album" ("artist_id");
 CREATE INDEX "Album_company_id" ON "Album" ("company_id");
+
+CREATE TABLE "Track" ("artist_id" integer NOT NULL REFERENCES "Musician" ("id") DEFERRABLE INITIALLY DEFERRED, "album_no" integer NOT NULL, "track_no" integer NOT NULL, "name" varchar(100) NOT NULL);
+CREATE UNIQUE INDEX "Track_artist_id_album_no_track_no_uniq" ON "Track" ("artist_id", "album_no", "track_no");
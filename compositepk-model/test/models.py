@@ -34,6 +34,8 @@ class CompanyBranch(CPkModel):
     name = models.CharField(max_length=100)
     established_date = models.DateField()
 
+    cache = CPkCache(timeout=3600)
+
     class Meta:
         managed = False
         db_table = 'CompanyBranch'
@@ -47,6 +49,8 @@ class Musician(CPkModel):
     last_name = models.CharField(max_length=50)
     profile = models.CharField(max_length=100)
 
+    cache = CPkCache()
+
     class Meta:
         managed = False
         db_table = 'Musician'
@@ -74,3 +78,29 @@ class Album(CPkModel):
         managed = False
         db_table = 'Album'
         unique_together = (('artist', 'album_no'),)
+
+
+# Grandchild Model (CpkModel)
+#   primary_key is composite-key: artist_id, album_no, track_no
+#   album is the relation by the composite-key: artist_id, album_no
+class Track(CPkModel):
+    artist = models.ForeignKey(
+        Musician,
+        primary_key=True,       # for CompositePK
+        on_delete=models.CASCADE)
+    album_no = models.IntegerField(
+        primary_key=True,       # for CompositePK
+    )
+    track_no = models.IntegerField(
+        primary_key=True,       # for CompositePK
+    )
+    name = models.CharField(max_length=100)
+    album = CPkForeignKey(
+        Album,
+        from_fields=('artist', 'album_no'),
+        on_delete=models.CASCADE)
+
+    class Meta:
+        managed = False
+        db_table = 'Track'
+        unique_together = (('artist', 'album_no', 'track_no'),)
@@ -3,11 +3,54 @@ This file demonstrates writing tests using the unittest module. These will pass
 when you run "manage.py test".
 """
 
+import datetime
+import io
+import json
+import os
+import tempfile
+from types import SimpleNamespace
+from unittest import mock
+
 import django
-from django.test import TestCase
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import ProgrammingError, connection, models, transaction
+from django.db.models import Q
+from django.db.models.deletion import RestrictedError
+from django.db.models.sql import UpdateQuery
+from django.db.models.signals import pre_delete
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+from django.test.utils import isolate_apps
+from django.views.generic.list import ListView
+
+from cpkmodel import CPkForeignKey, CPkManager, CPkModel, IdentityMapMiddleware, KeysetPaginationMixin, KeysetPaginator, collect_stats, cpk_event, identity_map
+from cpkmodel.rowcache import encode_key
+from cpkmodel.constants import IN_DERIVED, IN_DERIVED_THRESHOLD
+from cpkmodel.lookups import compile_compare
+from test.benchmarks import Benchmark, compare_results
+from test.models import Album, Company, CompanyBranch, Musician, Track
 
 # TODO: Configure your database in settings.py and sync before running tests.
 
+CREATE_TABLE_SQL = os.path.join(os.path.dirname(__file__), 'migration', 'Createtable.sql')
+
+
+def create_tables():
+    """ Create the unmanaged test tables by migration/Createtable.sql. """
+    if Album._meta.db_table in connection.introspection.table_names():
+        return
+    with open(CREATE_TABLE_SQL, encoding='utf-8') as f:
+        sqlite_part, postgresql_part = f.read().split('# For PsotgreSQL')
+    script = postgresql_part if connection.vendor == 'postgresql' else sqlite_part
+    lines = [line for line in script.splitlines() if not line.startswith('#')]
+    with connection.cursor() as cursor:
+        for sql in '\n'.join(lines).split(';'):
+            if sql.strip():
+                cursor.execute(sql)
+
+
 class ViewTest(TestCase):
     """Tests for the application views."""
 
@@ -22,3 +65,1310 @@ class ViewTest(TestCase):
         """Tests the home page."""
         response = self.client.get('/')
         self.assertContains(response, 'Home Page', 1, 200)
+
+
+class CPkTestCase(TestCase):
+    """Base class for tests using the CPkModel tables."""
+
+    @classmethod
+    def setUpClass(cls):
+        create_tables()
+        super().setUpClass()
+
+    @classmethod
+    def setUpTestData(cls):
+        today = datetime.date(2021, 6, 6)
+        cls.company = Company.objects.create(name='SME', established_date=today, company_code='SME')
+        cls.musician = Musician.objects.create(first_name='Michael', last_name='Jackson', profile='Pop')
+        cls.albums = [
+            Album.objects.create(
+                artist=cls.musician, album_no=no, name='Album %d' % no, release_date=today,
+                num_stars=3, item_code='ITEM%d' % no, company=cls.company,
+            )
+            for no in range(1, 6)
+        ]
+        cls.branches = [
+            CompanyBranch.objects.create(
+                company=cls.company, country_code=code, name='SME %s' % code, established_date=today,
+            )
+            for code in ('JP', 'US', 'UK')
+        ]
+
+
+class CompositeInTest(CPkTestCase):
+    """Tests for multi-column 'in' lookup."""
+
+    def test_pk_in(self):
+        artist_id = self.musician.id
+        qs = Album.objects.filter(pk__in=[(artist_id, 1), '%d,2' % artist_id, (self.musician, 3)])
+        self.assertEqual(sorted(a.album_no for a in qs), [1, 2, 3])
+
+    def test_multi_column_in(self):
+        qs = CompanyBranch.objects.filter(**{'country_code,name__in': [('JP', 'SME JP'), ('US', 'NONE')]})
+        self.assertEqual([b.country_code for b in qs], ['JP'])
+
+    def test_exclude_in(self):
+        qs = Album.objects.exclude(pk__in=[(self.musician.id, 1), (self.musician.id, 2)])
+        self.assertEqual(qs.count(), 3)
+
+    def test_empty_in(self):
+        self.assertEqual(Album.objects.filter(pk__in=[]).count(), 0)
+
+    def test_large_in(self):
+        keys = [(self.musician.id, no) for no in range(IN_DERIVED_THRESHOLD * 10)]
+        self.assertEqual(Album.objects.filter(pk__in=keys).count(), 5)
+
+    def test_in_unmatched_values(self):
+        artist_id = self.musician.id
+        with self.assertRaises(ValueError):
+            Album.objects.filter(pk__in=[(artist_id, 1), (artist_id, 1, 999)])
+        with self.assertRaises(ValueError):
+            Album.objects.filter(pk__in=[(artist_id,)])
+        with self.assertRaises(ValueError):
+            CompanyBranch.objects.filter(pk__in=['%d,A,B' % self.company.id])
+
+
+class BulkUpdateTest(CPkTestCase):
+    """Tests for CPkQuerySet.bulk_update."""
+
+    def check_bulk_update(self, use_join):
+        albums = list(Album.objects.filter(artist=self.musician))
+        for album in albums:
+            album.num_stars = album.album_no
+            album.name = 'New %d' % album.album_no
+        # 3 batches
+        with self.assertNumQueries(3):
+            rows = Album.objects.bulk_update(albums, ['num_stars', 'name'], batch_size=2, use_join=use_join)
+        self.assertEqual(rows, len(albums))
+        for album in Album.objects.all():
+            self.assertEqual(album.num_stars, album.album_no)
+            self.assertEqual(album.name, 'New %d' % album.album_no)
+
+    def test_bulk_update_by_join(self):
+        self.check_bulk_update(use_join=True)
+
+    def test_bulk_update_by_case(self):
+        self.check_bulk_update(use_join=False)
+
+    def test_bulk_update_key_with_separator(self):
+        today = datetime.date(2021, 6, 6)
+        for code in ('A', 'A,B'):
+            CompanyBranch.objects.create(company=self.company, country_code=code, name=code, established_date=today)
+        for use_join in (True, False):
+            branch = CompanyBranch.objects.get(pk=(self.company.id, 'A,B'))
+            branch.name = 'New %s' % use_join
+            self.assertEqual(CompanyBranch.objects.bulk_update([branch], ['name'], use_join=use_join), 1)
+            self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'A,B')).name, 'New %s' % use_join)
+            self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'A')).name, 'A')
+
+    def test_bulk_update_single_pk(self):
+        self.musician.profile = 'Rock'
+        self.assertEqual(Musician.objects.bulk_update([self.musician], ['profile']), 1)
+        self.assertEqual(Musician.objects.get(pk=self.musician.pk).profile, 'Rock')
+
+    def test_bulk_update_by_case_batch_size(self):
+        today = datetime.date(2021, 6, 6)
+        Album.objects.bulk_create([
+            Album(
+                artist=self.musician, album_no=no, name='Album %d' % no, release_date=today,
+                num_stars=3, item_code='ITEM%d' % no, company=self.company,
+            )
+            for no in range(6, 201)
+        ])
+        albums = list(Album.objects.all())
+        for album in albums:
+            album.num_stars = 1
+        fields = ['num_stars', 'name', 'item_code']
+        # 2 keys in the filter, and 2 keys + 1 value for each field.
+        batch_size = connection.ops.bulk_batch_size([None] * (2 + 3 * 3), albums)
+        num_batches = -(-len(albums) // batch_size)
+        with self.assertNumQueries(num_batches):
+            Album.objects.bulk_update(albums, fields, use_join=False)
+        self.assertEqual(Album.objects.filter(num_stars=1).count(), 200)
+
+
+class InBulkTest(CPkTestCase):
+    """Tests for CPkQuerySet.in_bulk."""
+
+    def test_in_bulk(self):
+        artist_id = self.musician.id
+        with self.assertNumQueries(2):
+            objs = Album.objects.in_bulk([(artist_id, 1), '%d,2' % artist_id, (artist_id, 3), (artist_id, 9)], batch_size=2)
+        self.assertEqual(sorted(objs), [(artist_id, 1), (artist_id, 2), (artist_id, 3)])
+        self.assertEqual(objs[(artist_id, 2)].name, 'Album 2')
+
+    def test_in_bulk_default_batch_size(self):
+        keys = [(self.musician.id, no) for no in range(1, 6)]
+        with self.assertNumQueries(1):
+            self.assertEqual(len(Album.objects.in_bulk(keys)), 5)
+        # Without the derived table, the keys are limited by max_query_params.
+        with mock.patch('cpkmodel.cpkquery.supports_derived_in', return_value=False), \
+                mock.patch.object(connection.features, 'max_query_params', 4):
+            with self.assertNumQueries(3):
+                self.assertEqual(len(Album.objects.in_bulk(keys)), 5)
+
+    def test_in_bulk_values(self):
+        key = (self.musician.id, 1)
+        for queryset in (Album.objects.values('name'), Album.objects.values_list('name'), Album.objects.rows('name')):
+            with self.assertRaises(TypeError):
+                queryset.in_bulk([key])
+
+    def test_in_bulk_all(self):
+        objs = CompanyBranch.objects.in_bulk()
+        self.assertEqual(objs[(self.company.id, 'JP')].name, 'SME JP')
+        self.assertEqual(len(objs), 3)
+
+    def test_in_bulk_empty(self):
+        with self.assertNumQueries(0):
+            self.assertEqual(Album.objects.in_bulk([]), {})
+
+    def test_in_bulk_single_pk(self):
+        objs = Musician.objects.in_bulk([self.musician.id])
+        self.assertEqual(objs, {self.musician.id: self.musician})
+
+
+class ManagerTest(TestCase):
+    """Tests for the managers of CPkModel."""
+
+    @isolate_apps('test')
+    def test_default_manager(self):
+        class Branch(CPkModel):
+            company_id = models.IntegerField(primary_key=True)
+            country_code = models.CharField(max_length=2, primary_key=True)
+
+        self.assertIsInstance(Branch.objects, CPkManager)
+        self.assertEqual([manager.name for manager in Branch._meta.managers], ['objects'])
+
+    @isolate_apps('test')
+    def test_declared_manager(self):
+        class BranchManager(CPkManager):
+            def japan(self):
+                return self.filter(country_code='JP')
+
+        class Branch(CPkModel):
+            company_id = models.IntegerField(primary_key=True)
+            country_code = models.CharField(max_length=2, primary_key=True)
+            branches = BranchManager()
+
+        self.assertEqual([manager.name for manager in Branch._meta.managers], ['branches'])
+        self.assertFalse(hasattr(Branch, 'objects'))
+
+        class OtherBranch(CPkModel):
+            company_id = models.IntegerField(primary_key=True)
+            country_code = models.CharField(max_length=2, primary_key=True)
+            objects = BranchManager()
+
+        self.assertIsInstance(OtherBranch.objects, BranchManager)
+        self.assertEqual(OtherBranch.objects.japan().query.model, OtherBranch)
+
+    @isolate_apps('test')
+    def test_inherited_manager(self):
+        class BranchManager(CPkManager):
+            pass
+
+        class Base(CPkModel):
+            branches = BranchManager()
+
+            class Meta:
+                abstract = True
+
+        class Branch(Base):
+            company_id = models.IntegerField(primary_key=True)
+            country_code = models.CharField(max_length=2, primary_key=True)
+
+        self.assertEqual([manager.name for manager in Branch._meta.managers], ['branches'])
+        self.assertIsInstance(Branch._default_manager, BranchManager)
+
+
+class BulkCreateTest(CPkTestCase):
+    """Tests for CPkQuerySet.bulk_create and bulk_upsert."""
+
+    def new_branches(self, name):
+        today = datetime.date(2021, 6, 6)
+        return [
+            CompanyBranch(company=self.company, country_code=code, name=name, established_date=today)
+            for code in ('JP', 'US', 'DE')
+        ]
+
+    def test_bulk_create_update_conflicts(self):
+        CompanyBranch.objects.bulk_create(
+            self.new_branches('Updated'), update_conflicts=True, update_fields=['name'],
+        )
+        self.assertEqual(CompanyBranch.objects.filter(name='Updated').count(), 3)
+        self.assertEqual(CompanyBranch.objects.count(), 4)
+
+    def test_bulk_create_ignore_conflicts(self):
+        CompanyBranch.objects.bulk_create(self.new_branches('Ignored'), ignore_conflicts=True)
+        self.assertEqual(CompanyBranch.objects.filter(name='Ignored').count(), 1)
+
+    def test_bulk_upsert(self):
+        with self.assertNumQueries(2):
+            counts = CompanyBranch.objects.bulk_upsert(self.new_branches('Updated'), batch_size=2)
+        self.assertEqual(counts, [2, 1])
+        self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'JP')).name, 'Updated')
+        self.assertEqual(CompanyBranch.objects.count(), 4)
+
+    def test_bulk_upsert_do_nothing(self):
+        counts = CompanyBranch.objects.bulk_upsert(self.new_branches('Ignored'), update_fields=[])
+        self.assertEqual(counts, [1])
+        self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'JP')).name, 'SME JP')
+
+
+class SaveUpsertTest(CPkTestCase):
+    """Tests for CPkModel.save(upsert=True)."""
+
+    def new_branch(self, code, name):
+        return CompanyBranch(
+            company=self.company, country_code=code, name=name, established_date=datetime.date(2021, 6, 6),
+        )
+
+    def test_save_upsert_update(self):
+        branch = self.new_branch('JP', 'Upserted')
+        with self.assertNumQueries(1):
+            branch.save(upsert=True)
+        self.assertFalse(branch._state.adding)
+        self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'JP')).name, 'Upserted')
+
+    def test_save_upsert_insert(self):
+        with self.assertNumQueries(1):
+            self.new_branch('FR', 'Upserted').save(upsert=True)
+        self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'FR')).name, 'Upserted')
+
+    def test_save_upsert_on_save(self):
+        CompanyBranch.upsert_on_save = True
+        try:
+            with self.assertNumQueries(1):
+                self.new_branch('JP', 'Upserted').save()
+        finally:
+            CompanyBranch.upsert_on_save = False
+        self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'JP')).name, 'Upserted')
+
+    def test_save_loaded(self):
+        branch = CompanyBranch.objects.get(pk=(self.company.id, 'JP'))
+        branch.name = 'Updated'
+        with self.assertNumQueries(1):
+            branch.save(upsert=True)
+        self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'JP')).name, 'Updated')
+
+
+class BulkDeleteTest(CPkTestCase):
+    """Tests for CPkQuerySet.bulk_delete."""
+
+    def test_bulk_delete(self):
+        albums = self.albums[:4]
+        # Each batch deletes the tracks and the albums by the keys.
+        with self.assertNumQueries(4):
+            deleted = Album.objects.bulk_delete(albums, batch_size=2)
+        self.assertEqual(deleted, (4, {'test.Album': 4}))
+        self.assertEqual([a.album_no for a in Album.objects.all()], [5])
+
+    def test_bulk_delete_with_signal(self):
+        deleted_pks = []
+
+        def receiver(instance, **kwargs):
+            deleted_pks.append(instance.pkvals)
+
+        pre_delete.connect(receiver, sender=Album)
+        try:
+            deleted = Album.objects.bulk_delete(self.albums[:2])
+        finally:
+            pre_delete.disconnect(receiver, sender=Album)
+        self.assertEqual(deleted, (2, {'test.Album': 2}))
+        self.assertEqual(sorted(deleted_pks), [(self.musician.id, 1), (self.musician.id, 2)])
+
+    def test_delete_cascade(self):
+        self.company.delete()
+        self.assertFalse(CompanyBranch.objects.exists())
+        self.assertFalse(Album.objects.exists())
+
+
+class CompositeKeyCacheTest(CPkTestCase):
+    """Tests for the cache of CompositeKey in CPkOptions."""
+
+    def test_get_composite_key(self):
+        meta = CompanyBranch._meta
+        ckey = meta.get_composite_key('country_code,name')
+        self.assertIs(meta.get_composite_key('country_code,name'), ckey)
+        self.assertEqual(ckey.names, ('country_code', 'name'))
+        qs = CompanyBranch.objects.filter(**{'country_code,name': ('JP', 'SME JP')})
+        self.assertEqual(qs.count(), 1)
+
+    def test_expire_cache(self):
+        meta = CompanyBranch._meta
+        ckey = meta.get_composite_key('country_code,name')
+        apps.clear_cache()
+        self.assertIsNot(meta.get_composite_key('country_code,name'), ckey)
+
+
+class PkValueTest(CPkTestCase):
+    """Tests for the cached pk of CPkModel."""
+
+    def test_pk(self):
+        album = Album.objects.get(pk=(self.musician.id, 2))
+        self.assertEqual(album.pk, '%d,2' % self.musician.id)
+        self.assertEqual(getattr(album, Album._meta.pk.attname), album.pk)
+        self.assertIs(album.pkvals, album.pkvals)
+
+    def test_assign_key(self):
+        album = Album.objects.get(pk=(self.musician.id, 2))
+        self.assertEqual(album.pkvals, (self.musician.id, 2))
+        album.album_no = 9
+        self.assertEqual(album.pkvals, (self.musician.id, 9))
+        self.assertEqual(album.pk, '%d,9' % self.musician.id)
+        album.artist = Musician(id=100)
+        self.assertEqual(album.pkvals, (100, 9))
+
+    def test_set_pk(self):
+        album = Album()
+        album.pk = '7,3'
+        self.assertEqual(album.pkvals, (7, 3))
+        album.pk = (8, '4')
+        self.assertEqual((album.artist_id, album.album_no), (8, 4))
+        album.pk = None
+        self.assertIsNone(album.pk)
+
+    def test_pkplan(self):
+        plan = Album.pkplan
+        self.assertEqual(plan.names, ('artist', 'album_no'))
+        self.assertEqual(plan.columns, ('artist_id', 'album_no'))
+        self.assertEqual(plan.getter(self.albums[0]), (self.musician.id, 1))
+        self.assertEqual(self.albums[0].get_pk_lookups(), {'artist_id': self.musician.id, 'album_no': 1})
+        self.assertEqual(Musician.pkplan.getter(self.musician), (self.musician.id,))
+
+
+class CPkForeignKeyTest(CPkTestCase):
+    """Tests for CPkForeignKey."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Track.objects.bulk_create([
+            Track(artist=cls.musician, album_no=no % 5 + 1, track_no=no, name='Track %d' % no)
+            for no in range(100)
+        ])
+
+    def test_related_fields(self):
+        field = Track._meta.get_field('album')
+        self.assertEqual([f.name for f in field.local_related_fields], ['artist', 'album_no'])
+        self.assertEqual([f.name for f in field.foreign_related_fields], ['artist', 'album_no'])
+
+    def test_select_related(self):
+        with self.assertNumQueries(1):
+            tracks = list(Track.objects.select_related('album'))
+            names = {track.album.name for track in tracks}
+        self.assertEqual(len(tracks), 100)
+        self.assertEqual(names, {'Album %d' % no for no in range(1, 6)})
+
+    def test_forward(self):
+        track = Track.objects.get(pk=(self.musician.id, 2, 1))
+        self.assertEqual(track.album.pkvals, (self.musician.id, 2))
+
+    def test_filter_traversal(self):
+        self.assertEqual(Track.objects.filter(album__name='Album 2').count(), 20)
+        self.assertEqual(Album.objects.filter(track__track_no=1).get().album_no, 2)
+
+    def test_filter_exact(self):
+        album = self.albums[1]
+        self.assertEqual(Track.objects.filter(album=album).count(), 20)
+        self.assertEqual(Track.objects.filter(album=(self.musician.id, 2)).count(), 20)
+        self.assertEqual(Track.objects.filter(album='%d,2' % self.musician.id).count(), 20)
+
+    def test_filter_in(self):
+        albums = [self.albums[0], (self.musician.id, 2), '%d,3' % self.musician.id]
+        self.assertEqual(Track.objects.filter(album__in=albums).count(), 60)
+        self.assertEqual(Track.objects.exclude(album__in=albums).count(), 40)
+
+    def test_reverse(self):
+        self.assertEqual(self.albums[0].track_set.count(), 20)
+
+    def test_delete_cascade(self):
+        deleted, rows_count = self.albums[0].delete()
+        self.assertEqual(rows_count, {'test.Album': 1, 'test.Track': 20})
+        self.assertEqual(Track.objects.count(), 80)
+
+
+class PrefetchRelatedTest(CPkTestCase):
+    """Tests for prefetch_related of the relations with composite keys."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Track.objects.bulk_create([
+            Track(artist=cls.musician, album_no=no % 5 + 1, track_no=no, name='Track %d' % no)
+            for no in range(20)
+        ])
+
+    def test_reverse_to_cpkmodel(self):
+        with self.assertNumQueries(2):
+            companies = list(Company.objects.prefetch_related('companybranch_set'))
+            codes = [branch.country_code for branch in companies[0].companybranch_set.all()]
+        self.assertEqual(sorted(codes), ['JP', 'UK', 'US'])
+
+    def test_forward_key_of_cpkmodel(self):
+        with self.assertNumQueries(2):
+            albums = list(Album.objects.prefetch_related('artist'))
+            artists = {album.artist.pk for album in albums}
+        self.assertEqual(artists, {self.musician.pk})
+
+    def test_forward_cpk_foreign_key(self):
+        with self.assertNumQueries(2):
+            tracks = list(Track.objects.prefetch_related('album'))
+            albums = {track.track_no: track.album.album_no for track in tracks}
+        self.assertEqual(albums, {no: no % 5 + 1 for no in range(20)})
+
+    def test_reverse_cpk_foreign_key(self):
+        # track.album is cached by the prefetch of track_set.
+        with self.assertNumQueries(2):
+            albums = list(Album.objects.prefetch_related('track_set__album'))
+            tracks = {album.album_no: [track.track_no for track in album.track_set.all()] for album in albums}
+            self.assertTrue(all(track.album is album for album in albums for track in album.track_set.all()))
+        self.assertEqual(tracks[1], [0, 5, 10, 15])
+
+    def test_chunked(self):
+        today = datetime.date(2021, 6, 6)
+        Album.objects.bulk_create([
+            Album(artist=self.musician, album_no=no, name='Album %d' % no, release_date=today,
+                  num_stars=3, item_code='ITEM%d' % no, company=self.company)
+            for no in range(6, 1001)
+        ])
+        Track.objects.bulk_create([
+            Track(artist=self.musician, album_no=no, track_no=1, name='Track %d' % no)
+            for no in range(6, 1001)
+        ])
+        fields = Track._meta.get_field('album').foreign_related_fields
+        batch_size = connection.ops.bulk_batch_size(fields, range(1000))
+        chunks = -(-1000 // batch_size)
+        with self.assertNumQueries(1 + chunks):
+            tracks = list(Track.objects.prefetch_related('album'))
+            names = {track.album.name for track in tracks}
+        self.assertEqual(len(names), 1000)
+
+    def test_multi_column_in_on_relation(self):
+        key = 'company__companybranch__company_id,country_code__in'
+        albums = Album.objects.filter(**{key: [(self.company.id, 'JP'), (0, 'JP')]})
+        self.assertEqual(albums.count(), 5)
+
+
+class KeysetPaginationTest(CPkTestCase):
+    """Tests for after/before of CPkQuerySet and KeysetPaginator."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.musician2 = Musician.objects.create(first_name='Janet', last_name='Jackson', profile='Pop')
+        Album.objects.bulk_create([
+            Album(artist=cls.musician2, album_no=no, name='Album %d' % no, release_date=datetime.date(2021, 6, 6),
+                  num_stars=3, item_code='ITEM%d' % no, company=cls.company)
+            for no in range(1, 6)
+        ])
+
+    def keys(self, objs):
+        return [obj.pkvals for obj in objs]
+
+    def test_after(self):
+        m1, m2 = self.musician.id, self.musician2.id
+        self.assertEqual(self.keys(Album.objects.after((m1, 4))), [(m1, 5)] + [(m2, no) for no in range(1, 6)])
+        self.assertEqual(self.keys(Album.objects.after('%d,5' % m1, inclusive=True)[:2]), [(m1, 5), (m2, 1)])
+
+    def test_before(self):
+        m1, m2 = self.musician.id, self.musician2.id
+        self.assertEqual(self.keys(Album.objects.before((m2, 2))[:3]), [(m2, 1), (m1, 5), (m1, 4)])
+        self.assertEqual(self.keys(Album.objects.before((m2, 1), inclusive=True)[:2]), [(m2, 1), (m1, 5)])
+
+    def test_after_single_pk(self):
+        self.assertEqual(list(Musician.objects.after((self.musician.id,))), [self.musician2])
+
+    def test_page(self):
+        paginator = KeysetPaginator(Album.objects.all(), 4)
+        paginator.count
+        with self.assertNumQueries(2):
+            page = paginator.page(2)
+        m1, m2 = self.musician.id, self.musician2.id
+        self.assertEqual(self.keys(page), [(m1, 5), (m2, 1), (m2, 2), (m2, 3)])
+        self.assertTrue(page.has_next())
+        self.assertEqual(self.keys(paginator.page(3)), [(m2, 4), (m2, 5)])
+
+    def test_page_descending(self):
+        paginator = KeysetPaginator(Album.objects.order_by('-pk'), 4)
+        m1, m2 = self.musician.id, self.musician2.id
+        self.assertEqual(self.keys(paginator.page(2)), [(m2, 1), (m1, 5), (m1, 4), (m1, 3)])
+
+    def test_page_after_before(self):
+        paginator = KeysetPaginator(Album.objects.all(), 4)
+        first = paginator.page_after()
+        self.assertFalse(first.has_previous())
+        with self.assertNumQueries(1):
+            second = paginator.page_after(first.next_key)
+        m1, m2 = self.musician.id, self.musician2.id
+        self.assertEqual(self.keys(second), [(m1, 5), (m2, 1), (m2, 2), (m2, 3)])
+        self.assertEqual(self.keys(paginator.page_before(second.previous_key)), self.keys(first))
+        last = paginator.page_after(second.next_key)
+        self.assertFalse(last.has_next())
+        self.assertIsNone(last.next_key)
+
+    def test_pagination_mixin(self):
+        class AlbumListView(KeysetPaginationMixin, ListView):
+            model = Album
+            paginate_by = 4
+
+        def get_context(**params):
+            view = AlbumListView()
+            view.setup(RequestFactory().get('/albums/', params))
+            view.object_list = view.get_queryset()
+            return view.get_context_data()
+
+        m1, m2 = self.musician.id, self.musician2.id
+        first = get_context()['page_obj']
+        self.assertEqual(first.number, 1)
+        self.assertEqual(first.next_cursor, '%d,4' % m1)
+        # Without COUNT and OFFSET.
+        with self.assertNumQueries(1):
+            context = get_context(after=first.next_cursor)
+        second = context['page_obj']
+        self.assertTrue(context['is_paginated'])
+        self.assertEqual(self.keys(context['object_list']), [(m1, 5), (m2, 1), (m2, 2), (m2, 3)])
+        self.assertEqual(second.previous_cursor, '%d,5' % m1)
+        self.assertEqual(self.keys(get_context(before=second.previous_cursor)['object_list']), self.keys(first))
+        self.assertFalse(get_context(after=second.next_cursor)['page_obj'].has_next())
+        for cursor in ('%d' % m1, '%d,x' % m1):
+            with self.assertRaises(Http404):
+                get_context(after=cursor)
+
+    def test_not_ordered_by_keys(self):
+        paginator = KeysetPaginator(Album.objects.order_by('name', 'pk'), 4)
+        self.assertIsNone(paginator.key_order)
+        self.assertEqual(len(paginator.page(3)), 2)
+
+
+class RangeLookupTest(CPkTestCase):
+    """Tests for gt/gte/lt/lte lookups on multi-column."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Track.objects.bulk_create([
+            Track(artist=cls.musician, album_no=album_no, track_no=track_no, name='Track %d' % track_no)
+            for album_no in range(1, 6) for track_no in range(1, 4)
+        ])
+
+    def test_pk(self):
+        m1 = self.musician.id
+        self.assertEqual(Album.objects.filter(pk__gt=(m1, 3)).count(), 2)
+        self.assertEqual(Album.objects.filter(pk__gte='%d,3' % m1).count(), 3)
+        self.assertEqual(Album.objects.filter(pk__lt=(self.musician, 3)).count(), 2)
+        self.assertEqual(Album.objects.exclude(pk__lte=(m1, 3)).count(), 2)
+        self.assertEqual(Track.objects.filter(pk__gt=(m1, 4, 2)).count(), 4)
+
+    def test_multi_column(self):
+        qs = Track.objects.filter(**{'album_no,track_no__lte': (2, 1)})
+        self.assertEqual(sorted(t.pkvals[1:] for t in qs), [(1, 1), (1, 2), (1, 3), (2, 1)])
+
+    def test_relation(self):
+        m1 = self.musician.id
+        self.assertEqual(Track.objects.filter(album__gte=(m1, 5)).count(), 3)
+        self.assertEqual(Track.objects.filter(album__lt=self.albums[1]).count(), 3)
+        self.assertEqual(Track.objects.filter(**{'album__artist,album_no__gt': (m1, 3)}).count(), 6)
+        self.assertEqual(Track.objects.filter(album__pk__lte='%d,2' % m1).count(), 6)
+
+    def test_parameter_unmatch(self):
+        with self.assertRaises(django.db.utils.ProgrammingError):
+            Album.objects.filter(pk__gt=(self.musician.id,))
+        with self.assertRaises(ValueError):
+            Track.objects.filter(album__gt=(self.musician.id,))
+
+    def test_compile(self):
+        keys = Album.pkplan.keys
+        cols = ['a', 'b']
+        sql, params = compile_compare(cols, keys, (1, 2), 'gt', SimpleNamespace(vendor='postgresql', ops=connection.ops))
+        self.assertEqual((sql, params), ('(a, b) > (%s, %s)', [1, 2]))
+        sql, params = compile_compare(cols, keys, (1, 2), 'lte', SimpleNamespace(vendor='sqlite', ops=connection.ops))
+        self.assertEqual(sql, 'a <= %s AND (a < %s OR (a = %s AND b <= %s))')
+        self.assertEqual(params, [1, 1, 1, 2])
+
+
+class IterByPkTest(CPkTestCase):
+    """Tests for CPkQuerySet.iter_by_pk."""
+
+    def test_iter_by_pk(self):
+        with self.assertNumQueries(3):
+            albums = [album.album_no for album in Album.objects.iter_by_pk(chunk_size=2)]
+        self.assertEqual(albums, [1, 2, 3, 4, 5])
+
+    def test_resume(self):
+        start = (self.musician.id, 2)
+        albums = Album.objects.filter(num_stars=3).iter_by_pk(chunk_size=2, start=start)
+        self.assertEqual([album.album_no for album in albums], [3, 4, 5])
+        albums = Album.objects.iter_by_pk(start='%d,5' % self.musician.id)
+        self.assertEqual(list(albums), [])
+
+    def test_values(self):
+        rows = Album.objects.values_list('name', 'artist', 'album_no').iter_by_pk(chunk_size=2)
+        self.assertEqual([row[0] for row in rows], ['Album %d' % no for no in range(1, 6)])
+        rows = Album.objects.values('album_no', 'artist').iter_by_pk(chunk_size=2, start=(self.musician.id, 3))
+        self.assertEqual([row['album_no'] for row in rows], [4, 5])
+        rows = Album.objects.values().iter_by_pk(chunk_size=4)
+        self.assertEqual(len(list(rows)), 5)
+
+    def test_values_without_keys(self):
+        with self.assertRaises(TypeError):
+            list(Album.objects.values_list('name').iter_by_pk())
+
+    def test_invalid_chunk_size(self):
+        with self.assertRaises(ValueError):
+            list(Album.objects.iter_by_pk(chunk_size=0))
+
+
+class IdentityMapTest(CPkTestCase):
+    """Tests for the identity map of CPkQuerySet."""
+
+    def test_get(self):
+        key = (self.company.id, 'JP')
+        with identity_map() as imap:
+            with self.assertNumQueries(1):
+                branch = CompanyBranch.objects.get(pk=key)
+                self.assertIs(CompanyBranch.objects.get(pk='%d,JP' % self.company.id), branch)
+                self.assertIs(CompanyBranch.objects.get(pk=(self.company, 'JP')), branch)
+            self.assertEqual(imap.stats, {'hits': 2, 'misses': 1, 'size': 1})
+        with self.assertNumQueries(1):
+            CompanyBranch.objects.get(pk=key)
+
+    def test_get_filtered(self):
+        with identity_map() as imap:
+            CompanyBranch.objects.get(pk=(self.company.id, 'JP'))
+            with self.assertNumQueries(1):
+                CompanyBranch.objects.filter(name='SME JP').get(pk=(self.company.id, 'JP'))
+            with self.assertNumQueries(1):
+                CompanyBranch.objects.only('name').get(pk=(self.company.id, 'JP'))
+            self.assertEqual(imap.hits, 0)
+
+    def test_in_bulk(self):
+        artist_id = self.musician.id
+        with identity_map() as imap:
+            album = Album.objects.get(pk=(artist_id, 1))
+            with self.assertNumQueries(1):
+                objs = Album.objects.in_bulk([(artist_id, 1), (artist_id, 2), (artist_id, 9)])
+            self.assertIs(objs[(artist_id, 1)], album)
+            self.assertEqual(sorted(objs), [(artist_id, 1), (artist_id, 2)])
+            with self.assertNumQueries(0):
+                objs = Album.objects.in_bulk([(artist_id, 1), '%d,2' % artist_id])
+            self.assertEqual(len(objs), 2)
+            self.assertEqual(imap.hits, 3)
+
+    def test_invalidate(self):
+        key = (self.company.id, 'JP')
+        with identity_map() as imap:
+            branch = CompanyBranch.objects.get(pk=key)
+            branch.save()
+            self.assertEqual(len(imap), 0)
+            CompanyBranch.objects.get(pk=key)
+            CompanyBranch.objects.filter(pk=key).update(name='SME Japan')
+            self.assertEqual(len(imap), 0)
+            branch = CompanyBranch.objects.get(pk=key)
+            self.assertEqual(branch.name, 'SME Japan')
+            branch.name = 'SME JP'
+            CompanyBranch.objects.bulk_update([branch], ['name'])
+            self.assertEqual(len(imap), 0)
+            Album.objects.get(pk=(self.musician.id, 1))
+            CompanyBranch.objects.get(pk=key).delete()
+            self.assertEqual(len(imap), 0)
+            with self.assertRaises(CompanyBranch.DoesNotExist):
+                CompanyBranch.objects.get(pk=key)
+
+    def test_middleware(self):
+        def get_response(request):
+            CompanyBranch.objects.get(pk=(self.company.id, 'JP'))
+            CompanyBranch.objects.get(pk=(self.company.id, 'JP'))
+            return request.identity_map.stats
+
+        middleware = IdentityMapMiddleware(get_response)
+        request = SimpleNamespace()
+        self.assertEqual(middleware(request), {'hits': 1, 'misses': 1, 'size': 1})
+        self.assertEqual(middleware(request), {'hits': 1, 'misses': 1, 'size': 1})
+
+
+class CPkCacheTest(CPkTestCase):
+    """Tests for CPkCache."""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_encode_key(self):
+        self.assertNotEqual(encode_key((1, 'A,B')), encode_key((1, 'A', 'B')))
+        self.assertNotEqual(encode_key(('1:A', 'B')), encode_key(('1', 'A|B')))
+
+    def test_get(self):
+        key = (self.company.id, 'JP')
+        with self.assertNumQueries(1):
+            branch = CompanyBranch.cache.get(key)
+            self.assertEqual(CompanyBranch.cache.get('%d,JP' % self.company.id), branch)
+            self.assertEqual(CompanyBranch.cache.get(key).name, 'SME JP')
+        self.assertFalse(branch._state.adding)
+        with self.assertRaises(CompanyBranch.DoesNotExist):
+            CompanyBranch.cache.get((self.company.id, 'FR'))
+
+    def test_get_single_pk(self):
+        with self.assertNumQueries(1):
+            Musician.cache.get(self.musician.id)
+            musician = Musician.cache.get(str(self.musician.id))
+        self.assertEqual(musician.last_name, 'Jackson')
+        self.assertEqual(Musician.cache.get_many([self.musician.id]), {self.musician.id: musician})
+
+    def test_get_many(self):
+        company_id = self.company.id
+        CompanyBranch.cache.get((company_id, 'JP'))
+        with self.assertNumQueries(1):
+            branches = CompanyBranch.cache.get_many([(company_id, 'JP'), (company_id, 'US'), (company_id, 'UK'), (company_id, 'FR')])
+        self.assertEqual(sorted(branches), [(company_id, 'JP'), (company_id, 'UK'), (company_id, 'US')])
+        with self.assertNumQueries(0):
+            branches = CompanyBranch.cache.get_many([(company_id, 'JP'), (company_id, 'US'), (company_id, 'UK')])
+        self.assertEqual(branches[(company_id, 'US')].name, 'SME US')
+
+    def test_invalidate(self):
+        key = (self.company.id, 'JP')
+        branch = CompanyBranch.cache.get(key)
+        branch.name = 'SME Japan'
+        branch.save()
+        self.assertEqual(CompanyBranch.cache.get(key).name, 'SME Japan')
+        CompanyBranch.objects.filter(pk=key).update(name='SME JP')
+        self.assertEqual(CompanyBranch.cache.get(key).name, 'SME JP')
+        branch.name = 'SME Nippon'
+        CompanyBranch.objects.bulk_update([branch], ['name'])
+        self.assertEqual(CompanyBranch.cache.get(key).name, 'SME Nippon')
+        branch.delete()
+        with self.assertRaises(CompanyBranch.DoesNotExist):
+            CompanyBranch.cache.get(key)
+
+    def read_before_write(self, key):
+        """ Read the row by the cache just before each write statement(e.g. by another thread). """
+        reading = []
+
+        def wrapper(execute, sql, params, many, context):
+            if not reading and sql.lstrip().startswith(('UPDATE', 'INSERT', 'DELETE')):
+                reading.append(sql)
+                try:
+                    CompanyBranch.cache.get(key)
+                except CompanyBranch.DoesNotExist:
+                    pass
+                finally:
+                    reading.pop()
+            return execute(sql, params, many, context)
+        return connection.execute_wrapper(wrapper)
+
+    def test_invalidate_after_write(self):
+        key = (self.company.id, 'JP')
+        branch = CompanyBranch.cache.get(key)
+        with self.read_before_write(key):
+            CompanyBranch.objects.filter(pk=key).update(name='NEW')
+        self.assertEqual(CompanyBranch.cache.get(key).name, 'NEW')
+        for use_join in (True, False):
+            branch.name = 'New %s' % use_join
+            with self.read_before_write(key):
+                CompanyBranch.objects.bulk_update([branch], ['name'], use_join=use_join)
+            self.assertEqual(CompanyBranch.cache.get(key).name, 'New %s' % use_join)
+        branch.name = 'Upserted'
+        with self.read_before_write(key):
+            CompanyBranch.objects.bulk_upsert([branch])
+        self.assertEqual(CompanyBranch.cache.get(key).name, 'Upserted')
+        with self.read_before_write(key):
+            CompanyBranch.objects.filter(pk=key).delete()
+        with self.assertRaises(CompanyBranch.DoesNotExist):
+            CompanyBranch.cache.get(key)
+        key = (self.company.id, 'US')
+        branch = CompanyBranch.cache.get(key)
+        with self.read_before_write(key):
+            branch.delete()
+        with self.assertRaises(CompanyBranch.DoesNotExist):
+            CompanyBranch.cache.get(key)
+
+    def test_invalidate_cascade(self):
+        CompanyBranch.cache.get((self.company.id, 'US'))
+        Company.objects.filter(pk=self.company.pk).delete()
+        with self.assertRaises(CompanyBranch.DoesNotExist):
+            CompanyBranch.cache.get((self.company.id, 'US'))
+
+
+class AsyncTest(CPkTestCase):
+    """Tests for the async methods of CPkQuerySet."""
+
+    async def test_aget(self):
+        branch = await CompanyBranch.objects.aget(pk=(self.company.id, 'JP'))
+        self.assertEqual(branch.name, 'SME JP')
+        album = await Album.objects.filter(name='Album 2').aget()
+        self.assertEqual(album.pkvals, (self.musician.id, 2))
+
+    async def test_ain_bulk(self):
+        artist_id = self.musician.id
+        objs = await Album.objects.ain_bulk([(artist_id, 1), '%d,2' % artist_id, (artist_id, 9)], batch_size=1)
+        self.assertEqual(sorted(objs), [(artist_id, 1), (artist_id, 2)])
+
+    async def test_abulk_update(self):
+        albums = [album async for album in Album.objects.filter(album_no__lte=2)]
+        for album in albums:
+            album.num_stars = 5
+        self.assertEqual(await Album.objects.abulk_update(albums, ['num_stars']), 2)
+        self.assertEqual(await Album.objects.filter(num_stars=5).acount(), 2)
+
+    async def test_abulk_delete(self):
+        branches = [branch async for branch in CompanyBranch.objects.filter(country_code__in=['JP', 'US'])]
+        deleted, _ = await CompanyBranch.objects.abulk_delete(branches)
+        self.assertEqual(deleted, 2)
+        self.assertEqual(await CompanyBranch.objects.acount(), 1)
+
+    async def test_aiter_by_pk(self):
+        albums = [album.album_no async for album in Album.objects.aiter_by_pk(chunk_size=2)]
+        self.assertEqual(albums, [1, 2, 3, 4, 5])
+        albums = [album async for album in Album.objects.aiter_by_pk(start=(self.musician.id, 5))]
+        self.assertEqual(albums, [])
+
+    async def test_identity_map(self):
+        with identity_map() as imap:
+            branch = await CompanyBranch.objects.aget(pk=(self.company.id, 'JP'))
+            self.assertIs(await CompanyBranch.objects.aget(pk=(self.company.id, 'JP')), branch)
+            self.assertEqual(imap.hits, 1)
+
+    async def test_view(self):
+        response = await self.async_client.get('/artisit/%d/album/json/' % self.musician.id)
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['artist'], 'Jackson')
+        self.assertEqual([album['album_no'] for album in data['albums']], [1, 2, 3, 4, 5])
+
+    async def test_identity_map_middleware(self):
+        async def get_response(request):
+            await CompanyBranch.objects.aget(pk=(self.company.id, 'JP'))
+            await CompanyBranch.objects.aget(pk=(self.company.id, 'JP'))
+            return request.identity_map.stats
+
+        middleware = IdentityMapMiddleware(get_response)
+        stats = await middleware(SimpleNamespace())
+        self.assertEqual(stats, {'hits': 1, 'misses': 1, 'size': 1})
+
+
+class BenchmarkTest(CPkTestCase):
+    """Tests for the benchmark runner(test/benchmarks.py)."""
+
+    def test_run(self):
+        keys = [album.pkvals for album in self.albums]
+        benchmark = Benchmark('filter_pk_in', lambda _: list(Album.objects.filter(pk__in=keys)), number=2, keys=5)
+        result = benchmark.run(repeat=3)
+        self.assertEqual(result['queries'], 1)
+        self.assertEqual(result['params'], {'keys': 5})
+        self.assertLessEqual(result['min_ms'], result['median_ms'])
+
+    def test_atomic(self):
+        benchmark = Benchmark('delete', lambda _: Album.objects.filter(album_no=1).delete(), atomic=True)
+        benchmark.run(repeat=2)
+        self.assertEqual(Album.objects.count(), 5)
+
+    def test_compare_results(self):
+        baseline = {'results': [
+            {'name': 'a', 'params': {'keys': 10}, 'median_ms': 1.0},
+            {'name': 'b', 'params': {}, 'median_ms': 1.0},
+        ]}
+        results = {'results': [
+            {'name': 'a', 'params': {'keys': 10}, 'median_ms': 1.5},
+            {'name': 'a', 'params': {'keys': 1000}, 'median_ms': 9.0},
+            {'name': 'b', 'params': {}, 'median_ms': 1.1},
+        ]}
+        regressions = compare_results(results, baseline, tolerance=0.2)
+        self.assertEqual([(result['name'], result['params']) for result, _ in regressions], [('a', {'keys': 10})])
+
+
+class InstrumentationTest(CPkTestCase):
+    """Tests for collect_stats and cpk_event."""
+
+    def test_collect_stats(self):
+        artist_id = self.musician.id
+        with collect_stats() as stats:
+            list(Album.objects.filter(pk=(artist_id, 1)))
+            list(Album.objects.filter(pk__in=[(artist_id, 1), (artist_id, 2)]))
+        self.assertEqual(stats.counts['transform_q'], 2)
+        self.assertGreaterEqual(stats.counts['names_to_path'], 2)
+        self.assertEqual(stats.counts['composite_col'], 1)
+        self.assertEqual(stats.in_keys, [2])
+        self.assertEqual(sum(stats.in_strategies.values()), 1)
+        self.assertGreater(stats.timings['transform_q'], 0)
+        self.assertEqual(set(stats.as_dict()), {'counts', 'timings', 'in_keys', 'in_strategies', 'batches'})
+        with self.assertNumQueries(1):
+            list(Album.objects.filter(pk__in=[(artist_id, 1)]))
+        self.assertEqual(stats.in_keys, [2])
+
+    def test_in_derived(self):
+        keys = [(self.musician.id, no) for no in range(IN_DERIVED_THRESHOLD + 1)]
+        with collect_stats() as stats:
+            list(Album.objects.filter(pk__in=keys))
+        self.assertEqual(stats.in_keys, [len(keys)])
+        if connection.vendor in ('sqlite', 'postgresql'):
+            self.assertEqual(dict(stats.in_strategies), {IN_DERIVED: 1})
+
+    def test_bulk_update(self):
+        for album in self.albums:
+            album.num_stars = 4
+        with collect_stats() as stats:
+            Album.objects.bulk_update(self.albums, ['num_stars'], batch_size=2, use_join=False)
+        self.assertEqual(dict(stats.batches), {'case': 3})
+        self.assertEqual(stats.counts['bulk_update'], 1)
+
+    def test_signal(self):
+        events = []
+
+        def receiver(sender, event, elapsed, signal, **info):
+            events.append((sender, event, info))
+
+        cpk_event.connect(receiver)
+        try:
+            list(CompanyBranch.objects.filter(pk__in=[(self.company.id, 'JP')]))
+        finally:
+            cpk_event.disconnect(receiver)
+        in_events = [info for sender, event, info in events if event == 'in']
+        self.assertEqual([info['keys'] for info in in_events], [1])
+        self.assertIn((CompanyBranch, 'transform_q', {}), events)
+
+
+class FetchTest(CPkTestCase):
+    """Tests for CPkQuerySet.fetch and fetch_many."""
+
+    def test_fetch(self):
+        artist_id = self.musician.id
+        with self.assertNumQueries(1):
+            album = Album.objects.fetch((artist_id, 2))
+        self.assertEqual(album, Album.objects.get(pk=(artist_id, 2)))
+        self.assertEqual(album.release_date, datetime.date(2021, 6, 6))
+        self.assertFalse(album._state.adding)
+        self.assertEqual(album._state.db, 'default')
+        self.assertEqual(Album.objects.fetch('%d,3' % artist_id).name, 'Album 3')
+        with self.assertRaises(Album.DoesNotExist):
+            Album.objects.fetch((artist_id, 9))
+
+    def test_fetch_fields(self):
+        album = Album.objects.fetch((self.musician.id, 1), fields=['name'])
+        self.assertEqual(album.name, 'Album 1')
+        self.assertEqual(album.get_deferred_fields(), {'release_date', 'num_stars', 'item_code', 'company_id'})
+
+    def test_fetch_single_pk(self):
+        self.assertEqual(Musician.objects.fetch(self.musician.id).last_name, 'Jackson')
+
+    def test_fetch_filtered(self):
+        branches = CompanyBranch.objects.filter(name='SME US')
+        with self.assertRaises(CompanyBranch.DoesNotExist):
+            branches.fetch((self.company.id, 'JP'))
+        self.assertEqual(branches.fetch((self.company.id, 'US')).name, 'SME US')
+        self.assertEqual(list(branches.fetch_many([(self.company.id, 'JP'), (self.company.id, 'US')])), [(self.company.id, 'US')])
+
+    def test_fetch_many(self):
+        company_id = self.company.id
+        with self.assertNumQueries(1):
+            branches = CompanyBranch.objects.fetch_many([(company_id, 'JP'), '%d,US' % company_id, (company_id, 'FR')])
+        self.assertEqual(sorted(branches), [(company_id, 'JP'), (company_id, 'US')])
+        self.assertEqual(branches[(company_id, 'US')].established_date, datetime.date(2021, 6, 6))
+        with self.assertNumQueries(0):
+            self.assertEqual(CompanyBranch.objects.fetch_many([]), {})
+        self.assertEqual(Musician.objects.fetch_many([self.musician.id]), {self.musician.id: self.musician})
+
+    def test_identity_map(self):
+        with identity_map():
+            album = Album.objects.fetch((self.musician.id, 1))
+            with self.assertNumQueries(0):
+                self.assertIs(Album.objects.fetch((self.musician.id, 1)), album)
+
+
+class FoldEqualitiesTest(CPkTestCase):
+    """Tests for folding OR-ed composite key equalities into 'in'."""
+
+    def get_lookups(self, queryset):
+        where = queryset.query.where
+        while len(where.children) == 1 and hasattr(where.children[0], 'children'):
+            where = where.children[0]
+        return where.children
+
+    def test_filter(self):
+        artist_id = self.musician.id
+        q = Q(pk=(artist_id, 1)) | Q(pk='%d,2' % artist_id) | Q(pk__exact=(artist_id, 9))
+        albums = Album.objects.filter(q)
+        lookups = self.get_lookups(albums)
+        self.assertEqual(len(lookups), 1)
+        self.assertEqual(lookups[0].lookup_name, 'in')
+        self.assertEqual(sorted(album.album_no for album in albums), [1, 2])
+
+    def test_mixed(self):
+        artist_id = self.musician.id
+        albums = Album.objects.filter(Q(pk=(artist_id, 1)) | Q(name='Album 3') | Q(pk=(artist_id, 2)))
+        self.assertEqual(len(self.get_lookups(albums)), 2)
+        self.assertEqual(sorted(album.album_no for album in albums), [1, 2, 3])
+        # AND is not folded.
+        albums = Album.objects.filter(Q(pk=(artist_id, 1)) & Q(name='Album 1'))
+        self.assertEqual([album.album_no for album in albums], [1])
+
+    def test_multi_column(self):
+        company_id = self.company.id
+        q = Q(**{'company,country_code': (company_id, 'JP')}) | Q(**{'company,country_code': (company_id, 'US')})
+        branches = CompanyBranch.objects.filter(q)
+        self.assertEqual(len(self.get_lookups(branches)), 1)
+        self.assertEqual(sorted(branch.country_code for branch in branches), ['JP', 'US'])
+
+    def test_exclude(self):
+        artist_id = self.musician.id
+        albums = Album.objects.exclude(Q(pk=(artist_id, 1)) | Q(pk=(artist_id, 3)) | Q(pk=(artist_id, None)))
+        self.assertIn('NOT', str(albums.query))
+        self.assertEqual(sorted(album.album_no for album in albums), [2, 4, 5])
+
+    def test_unmatch(self):
+        with self.assertRaises(ProgrammingError):
+            Album.objects.filter(Q(pk=(self.musician.id,)) | Q(pk=(self.musician.id, 2)))
+
+
+class QuerySetDeleteTest(CPkTestCase):
+    """Tests for CPkQuerySet.delete by the keys."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Track.objects.bulk_create([
+            Track(artist=cls.musician, album_no=album_no, track_no=track_no, name='Track %d' % track_no)
+            for album_no in (1, 2, 3) for track_no in (1, 2)
+        ])
+
+    def test_fast_delete(self):
+        with self.assertNumQueries(1):
+            deleted = Track.objects.filter(album_no=1).delete()
+        self.assertEqual(deleted, (2, {'test.Track': 2}))
+
+    def test_delete_with_join(self):
+        deleted = Track.objects.filter(artist__last_name='Jackson', album_no=2).delete()
+        self.assertEqual(deleted, (2, {'test.Track': 2}))
+        self.assertEqual(Track.objects.count(), 4)
+
+    def test_delete_cascade(self):
+        with self.assertNumQueries(3) as ctx:
+            deleted = Album.objects.filter(num_stars=3, album_no__lte=2).delete()
+        self.assertEqual(deleted, (6, {'test.Track': 4, 'test.Album': 2}))
+        # Only the keys are fetched.
+        select_sql = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        self.assertEqual(len(select_sql), 1)
+        self.assertNotIn('"name"', select_sql[0])
+        self.assertEqual([album.album_no for album in Album.objects.all()], [3, 4, 5])
+        self.assertEqual(Track.objects.count(), 2)
+
+    def test_delete_chunks(self):
+        with mock.patch('cpkmodel.cpkquery.DELETE_CHUNK_SIZE', 2):
+            with self.assertNumQueries(9):
+                deleted = Album.objects.all().delete()
+        self.assertEqual(deleted, (11, {'test.Track': 6, 'test.Album': 5}))
+        self.assertFalse(Album.objects.exists())
+
+    def test_delete_with_signal(self):
+        deleted_pks = []
+
+        def receiver(instance, **kwargs):
+            deleted_pks.append(instance.pkvals)
+
+        pre_delete.connect(receiver, sender=Album)
+        try:
+            deleted = Album.objects.filter(album_no=1).delete()
+        finally:
+            pre_delete.disconnect(receiver, sender=Album)
+        self.assertEqual(deleted, (3, {'test.Track': 2, 'test.Album': 1}))
+        self.assertEqual(deleted_pks, [(self.musician.id, 1)])
+
+    def test_delete_restricted(self):
+        # A model referring to Track by RESTRICT, registered only in this test.
+        class Lyric(CPkModel):
+            artist = models.ForeignKey(Musician, primary_key=True, on_delete=models.CASCADE, related_name='+')
+            album_no = models.IntegerField(primary_key=True)
+            track_no = models.IntegerField(primary_key=True)
+            text = models.CharField(max_length=100)
+            track = CPkForeignKey(
+                Track, from_fields=('artist', 'album_no', 'track_no'), on_delete=models.RESTRICT, related_name='+')
+
+            class Meta:
+                app_label = 'test'
+                managed = False
+                db_table = 'Lyric'
+
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'CREATE TABLE "Lyric" ("artist_id" integer NOT NULL, "album_no" integer NOT NULL, '
+                    '"track_no" integer NOT NULL, "text" varchar(100) NOT NULL)'
+                )
+            Lyric.objects.create(artist=self.musician, album_no=1, track_no=1, text='la la')
+            # The tracks are deleted by the cascade from Album, not the albums themselves.
+            # Rolled back with the chunks deleted, so the savepoint is needed to go on.
+            with self.assertRaises(RestrictedError), transaction.atomic():
+                Album.objects.filter(album_no=1).exclude(name='zzz').delete()
+            with self.assertRaises(RestrictedError), transaction.atomic():
+                Album.objects.bulk_delete(Album.objects.filter(album_no=1))
+            self.assertTrue(Album.objects.filter(album_no=1).exists())
+            self.assertEqual(Track.objects.filter(album_no=1).count(), 2)
+            self.assertEqual(Lyric.objects.count(), 1)
+        finally:
+            del apps.all_models['test']['lyric']
+            apps.clear_cache()
+
+
+class KeySeparatorTest(CPkTestCase):
+    """Tests for the key values containing CPK_SEP, deleted or updated by Collector."""
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for code in ('A', 'A,B'):
+            CompanyBranch.objects.create(
+                company=cls.company, country_code=code, name=code, established_date=datetime.date(2021, 6, 6),
+            )
+
+    def assertBranches(self, codes):
+        self.assertEqual(
+            sorted(CompanyBranch.objects.filter(country_code__startswith='A').values_list('country_code', flat=True)),
+            codes,
+        )
+
+    def get_branch(self):
+        return CompanyBranch.objects.get(pk=(self.company.id, 'A,B'))
+
+    def test_pk(self):
+        branch = self.get_branch()
+        self.assertEqual(branch.pk, '%d,A,B' % self.company.id)
+        self.assertEqual(list(CompanyBranch.objects.filter(pk=branch.pk)), [branch])
+        self.assertEqual(list(CompanyBranch.objects.filter(pk__in=[branch.pk])), [branch])
+        other = CompanyBranch()
+        other.pk = branch.pk
+        self.assertEqual(other.pkvals, (self.company.id, 'A,B'))
+
+    def test_delete(self):
+        self.assertEqual(self.get_branch().delete(), (1, {'test.CompanyBranch': 1}))
+        self.assertBranches(['A'])
+
+    def test_bulk_delete(self):
+        self.assertEqual(CompanyBranch.objects.bulk_delete([self.get_branch()]), (1, {'test.CompanyBranch': 1}))
+        self.assertBranches(['A'])
+
+    def test_queryset_delete(self):
+        self.assertEqual(CompanyBranch.objects.filter(country_code='A,B').delete(), (1, {'test.CompanyBranch': 1}))
+        self.assertBranches(['A'])
+
+    def test_update_batch(self):
+        # The update of Collector(e.g. SET_NULL).
+        UpdateQuery(CompanyBranch).update_batch([self.get_branch().pk], {'name': 'New'}, 'default')
+        self.assertEqual(self.get_branch().name, 'New')
+        self.assertEqual(CompanyBranch.objects.get(pk=(self.company.id, 'A')).name, 'A')
+
+
+class RowsTest(CPkTestCase):
+    """Tests for CPkQuerySet.rows."""
+
+    def test_rows(self):
+        artist_id = self.musician.id
+        rows = list(Album.objects.rows('name', 'num_stars').filter(album_no__lte=2).order_by('pk'))
+        self.assertEqual([row.key for row in rows], [(artist_id, 1), (artist_id, 2)])
+        self.assertEqual(rows[0].name, 'Album 1')
+        self.assertEqual(rows[0]._fields, ('key', 'name', 'num_stars'))
+        self.assertEqual(rows[1], ((artist_id, 2), 'Album 2', 3))
+        self.assertFalse(hasattr(rows[0], '__dict__'))
+
+    def test_rows_all_fields(self):
+        row = CompanyBranch.objects.rows().get(pk=(self.company.id, 'JP'))
+        self.assertEqual(row.key, (self.company.id, 'JP'))
+        self.assertEqual(row.company_id, self.company.id)
+        self.assertEqual(row.established_date, datetime.date(2021, 6, 6))
+
+    def test_rows_key_fields(self):
+        artist_id = self.musician.id
+        row = Album.objects.rows('pk', 'name').get(pk=(artist_id, 3))
+        self.assertEqual(row, ((artist_id, 3), artist_id, 3, 'Album 3'))
+        self.assertEqual(row._fields, ('key', 'artist', 'album_no', 'name'))
+        self.assertEqual(Album.objects.rows('pk', 'name').query.values_select, ('artist_id', 'album_no', 'name'))
+        self.assertEqual(Musician.objects.rows('first_name').get().key, (artist_id,))
+
+    def test_rows_related(self):
+        row = Album.objects.rows('artist__last_name').first()
+        self.assertEqual(row.artist__last_name, 'Jackson')
+        with self.assertRaises(ValueError):
+            Album.objects.rows('key')
+
+    def test_iter_by_pk(self):
+        rows = Album.objects.rows('name').iter_by_pk(chunk_size=2, start=(self.musician.id, 1))
+        self.assertEqual([row.name for row in rows], ['Album %d' % no for no in range(2, 6)])
+
+
+class ExportTest(CPkTestCase):
+    """Tests for CPkQuerySet.export and the cpkexport command."""
+
+    def test_export_csv(self):
+        artist_id = self.musician.id
+        fp = io.StringIO()
+        checkpoints = []
+        with self.assertNumQueries(3):
+            result = Album.objects.export(fp, chunk_size=2, checkpoint=lambda key, rows: checkpoints.append((key, rows)))
+        self.assertEqual(result, (5, (artist_id, 5)))
+        self.assertEqual(checkpoints, [((artist_id, 2), 2), ((artist_id, 4), 4), ((artist_id, 5), 5)])
+        lines = fp.getvalue().splitlines()
+        self.assertEqual(lines[0], 'artist_id,album_no,name,release_date,num_stars,item_code,company_id')
+        self.assertEqual(lines[1], '%d,1,Album 1,2021-06-06,3,ITEM1,%d' % (artist_id, self.company.id))
+        self.assertEqual(len(lines), 6)
+
+    def test_export_ndjson(self):
+        fp = io.StringIO()
+        result = CompanyBranch.objects.filter(country_code__in=['JP', 'US']).export(
+            fp, format='ndjson', fields=['name', 'established_date'],
+        )
+        self.assertEqual(result, (2, (self.company.id, 'US')))
+        self.assertEqual([json.loads(line) for line in fp.getvalue().splitlines()], [
+            {'name': 'SME JP', 'established_date': '2021-06-06'},
+            {'name': 'SME US', 'established_date': '2021-06-06'},
+        ])
+
+    def test_export_resume(self):
+        artist_id = self.musician.id
+        fp = io.StringIO()
+        self.assertEqual(Album.objects.export(fp, fields=['pk', 'name'], start=(artist_id, 3)), (2, (artist_id, 5)))
+        self.assertEqual(fp.getvalue().splitlines(), ['%d,4,Album 4' % artist_id, '%d,5,Album 5' % artist_id])
+        fp = io.StringIO()
+        self.assertEqual(Album.objects.export(fp, start=(artist_id, 5)), (0, (artist_id, 5)))
+        self.assertEqual(fp.getvalue(), '')
+        with self.assertRaises(ValueError):
+            Album.objects.export(fp, format='xml')
+
+    def test_command(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'album.csv')
+            checkpoint = os.path.join(tmp_dir, 'album.json')
+            options = dict(fields=['name'], output=output, checkpoint=checkpoint, stderr=io.StringIO())
+            call_command('cpkexport', 'test.Album', chunk_size=2, **options)
+            with open(checkpoint, encoding='utf-8') as f:
+                self.assertEqual(json.load(f), {'key': [self.musician.id, 5], 'rows': 5, 'offset': os.path.getsize(output)})
+            Album.objects.create(
+                artist=self.musician, album_no=6, name='Album 6', release_date=datetime.date(2021, 6, 6),
+                num_stars=3, item_code='ITEM6', company=self.company,
+            )
+            # resumed after the checkpoint
+            call_command('cpkexport', 'test.Album', **options)
+            with open(output, encoding='utf-8') as f:
+                self.assertEqual(f.read().splitlines(), ['name'] + ['Album %d' % no for no in range(1, 7)])
+            with open(checkpoint, encoding='utf-8') as f:
+                self.assertEqual(json.load(f), {'key': [self.musician.id, 6], 'rows': 6, 'offset': os.path.getsize(output)})
+
+    def test_command_interrupted(self):
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            output = os.path.join(tmp_dir, 'album.ndjson')
+            checkpoint = os.path.join(tmp_dir, 'album.json')
+            options = dict(format='ndjson', fields=['name'], output=output, checkpoint=checkpoint, stderr=io.StringIO())
+            call_command('cpkexport', 'test.Album', chunk_size=2, **options)
+            # Interrupted after the chunk was flushed(before the checkpoint), in the middle of a line.
+            with open(output, 'a', encoding='utf-8') as f:
+                f.write('{"name": "Album 5"}\n{"name": "Alb')
+            call_command('cpkexport', 'test.Album', **options)
+            with open(output, encoding='utf-8') as f:
+                self.assertEqual([json.loads(line)['name'] for line in f], ['Album %d' % no for no in range(1, 6)])
+            os.remove(output)
+            with self.assertRaises(CommandError):
+                call_command('cpkexport', 'test.Album', **options)
+
+    def test_command_stdout(self):
+        stdout = io.StringIO()
+        call_command('cpkexport', 'test.CompanyBranch', format='ndjson', fields=['pk'], stdout=stdout, stderr=io.StringIO())
+        self.assertEqual([json.loads(line)['country_code'] for line in stdout.getvalue().splitlines()], ['JP', 'UK', 'US'])
+        with self.assertRaises(CommandError):
+            call_command('cpkexport', 'test.Company')
+        with self.assertRaises(CommandError):
+            call_command('cpkexport', 'test.Album', fields=['nothing'])
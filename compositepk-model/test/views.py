@@ -5,7 +5,7 @@ Definition of views.
 from datetime import datetime
 
 from django.shortcuts import render
-from django.http import HttpRequest,HttpResponseRedirect
+from django.http import HttpRequest,HttpResponseRedirect,JsonResponse
 from django.views.generic.list import ListView
 from django.views.generic.edit import FormView
 from django.db.models import Max
@@ -124,6 +124,15 @@ def set_5stars(request, id):
  
     return HttpResponseRedirect("/artisit/{}/album/".format(id))
 
+async def album_json(request, id):
+    """  async test : aget, aiter_by_pk """
+    musician = await Musician.objects.aget(id=id)
+    albums = [
+        {'album_no': album.album_no, 'name': album.name}
+        async for album in Album.objects.filter(artist=musician).aiter_by_pk(chunk_size=2)
+    ]
+    return JsonResponse({'artist': musician.last_name, 'albums': albums})
+
 ################
 # Company
 ################
@@ -203,7 +212,6 @@ def test_filter(request):
     company = Company.objects.last()
     qs_kv_name_startwith = Album.objects.filter(name__startswith='N').values('artist', 'album_no')
     #qs_kv_name_startwith = Album.objects.filter(name__startswith='N')
-    SQLite_error = "##[SQLite]NG, [PostgreSQL]OK"
     test_data = (
         (1, 'artist', musician, ""),
         (2, 'artist', musician.id, ""),
@@ -227,15 +235,15 @@ def test_filter(request):
         (132, 'company__companybranch__country_code__startswith', 'U', ""),
         (191, 'artist__pk', musician.id, "## Not Supported ##"),
         # __in
-        (201, 'pk__in', [(musician.id, 1)], SQLite_error),
-        (202, 'pk__in', [(1, 1),(2,1)],SQLite_error),
-        (203, 'pk__in', ['1,1','2,1'], SQLite_error),
-        (204, 'pk__in', qs_kv_name_startwith, SQLite_error),
-        (205, 'pk__in', list(qs_kv_name_startwith), SQLite_error),
-        (211, 'artist_id,album_no__in', [(1, 1),(2,1)], SQLite_error),
-        (212, 'artist,album_no__in', [(1, 1),(1,2)], SQLite_error),
-        (221, 'artist,album_no__in', qs_kv_name_startwith, SQLite_error),
-        (222, 'artist_id,album_no__in', qs_kv_name_startwith, SQLite_error),
+        (201, 'pk__in', [(musician.id, 1)], ""),
+        (202, 'pk__in', [(1, 1),(2,1)], ""),
+        (203, 'pk__in', ['1,1','2,1'], ""),
+        (204, 'pk__in', qs_kv_name_startwith, ""),
+        (205, 'pk__in', list(qs_kv_name_startwith), ""),
+        (211, 'artist_id,album_no__in', [(1, 1),(2,1)], ""),
+        (212, 'artist,album_no__in', [(1, 1),(1,2)], ""),
+        (221, 'artist,album_no__in', qs_kv_name_startwith, ""),
+        (222, 'artist_id,album_no__in', qs_kv_name_startwith, ""),
         (231, 'num_stars__in', [4,5], ""),
         (232, 'album_no__in', [1], ""),
         # relation + __in
@@ -244,8 +252,8 @@ def test_filter(request):
         (311, 'company__pk__in', [1,2,3,4], ""),
         (312, 'company__id__in', [2,3,4], ""),
         (321, 'company__companybranch__company_id,country_code', (1,'JP'), ""),
+        (322, 'company__companybranch__company_id,country_code__in', [(1,'JP'),(2,'JP')], ""),
         # Not Supported
-        (901, 'company__companybranch__company_id,country_code__in', [(1,'JP'),(2,'JP')], "## Not Supported ##"),
         (911, 'name,item_code__contains', ('Mic','TEST'), "## Not Supported ##"),
     )
 